@@ -0,0 +1,173 @@
+"""
+Throughput benchmark of WolfSheep.step
+================================
+
+Builds models over a matrix of grid sizes, densities, neighborhoods, grass,
+aging and engines, each case in a fresh process, and reports:
+
+    - construction time
+    - steps per second
+    - agent updates per second (animals alive at each step, summed)
+    - peak resident memory of the process
+
+Results are written as JSON so two commits can be compared:
+
+    python benchmarks/bench_step.py --output before.json
+    python benchmarks/bench_step.py --output after.json --compare before.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prey_predator.agents import Sheep, Wolf  # noqa: E402
+from prey_predator.model import WolfSheep  # noqa: E402
+
+
+MATRIX = {
+    "size": [20, 100, 300],
+    "density": [0.1, 0.5],
+    "moore": [False, True],
+    "grass": [False, True],
+    "aging_effect": [False, True],
+    "engine": ["agents", "numpy"],
+}
+
+QUICK_MATRIX = {
+    "size": [20, 100],
+    "density": [0.5],
+    "moore": [False],
+    "grass": [True],
+    "aging_effect": [False],
+    "engine": ["agents", "numpy"],
+}
+
+# Parameters close to the ones of the server, for which populations survive
+FIXED_PARAMS = {
+    "sheep_reproduce": 0.22,
+    "wolf_reproduce": 0.05,
+    "wolf_gain_from_food": 3,
+    "sheep_gain_from_food": 4,
+    "grass_regrowth_time": 7,
+    "death_age_wolf": 29,
+    "death_age_sheep": 19,
+}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the current process, in MB"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return maxrss / 1024 ** 2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_case(case: Dict[str, Any], steps: int, seed: int) -> Dict[str, Any]:
+    """Build and run one model, meant to be called in a fresh process"""
+    params = dict(FIXED_PARAMS,
+                  width=case["size"],
+                  height=case["size"],
+                  density_sheep=case["density"],
+                  density_wolves=case["density"],
+                  moore=case["moore"],
+                  grass=case["grass"],
+                  aging_effect=case["aging_effect"],
+                  engine=case["engine"],
+                  seed=seed)
+
+    start = time.perf_counter()
+    model = WolfSheep(**params)
+    construction_time = time.perf_counter() - start
+
+    agent_updates = 0
+    steps_done = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        agent_updates += model.schedule.get_breed_count(Sheep) + model.schedule.get_breed_count(Wolf)
+        model.step()
+        steps_done += 1
+        if model.schedule.get_breed_count(Sheep) + model.schedule.get_breed_count(Wolf) == 0:
+            break
+    step_time = time.perf_counter() - start
+
+    return dict(case,
+                steps=steps_done,
+                construction_time=construction_time,
+                steps_per_second=steps_done / step_time,
+                agent_updates_per_second=agent_updates / step_time,
+                peak_rss_mb=peak_rss_mb())
+
+
+def case_name(case: Dict[str, Any]) -> str:
+    return ",".join(f"{key}={case[key]}" for key in MATRIX)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: List[Dict[str, Any]], reference_path: str) -> None:
+    """Print the speedup of each case over a previous result file"""
+    with open(reference_path) as file:
+        reference = {case_name(r): r for r in json.load(file)["results"]}
+    print(f"\n{'case':<80} {'steps/s ratio':>14} {'rss ratio':>10}")
+    for result in results:
+        before = reference.get(case_name(result))
+        if before is None:
+            continue
+        speedup = result["steps_per_second"] / before["steps_per_second"]
+        memory = result["peak_rss_mb"] / before["peak_rss_mb"]
+        print(f"{case_name(result):<80} {speedup:>14.2f} {memory:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the throughput of WolfSheep.step")
+    parser.add_argument("--steps", type=int, default=50, help="Steps run for each case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="Run a small matrix only")
+    parser.add_argument("--engine", choices=["agents", "numpy"], help="Only benchmark one engine")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    args = parser.parse_args()
+
+    matrix = dict(QUICK_MATRIX if args.quick else MATRIX)
+    if args.engine:
+        matrix["engine"] = [args.engine]
+    cases = [dict(zip(matrix, values)) for values in itertools.product(*matrix.values())]
+
+    # One process per case so that the peak memory is the case's own
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for case in cases:
+            result = pool.apply(run_case, (case, args.steps, args.seed))
+            results.append(result)
+            print(f"{case_name(case):<80} {result['steps_per_second']:>10.1f} steps/s "
+                  f"{result['agent_updates_per_second']:>12.0f} updates/s "
+                  f"{result['peak_rss_mb']:>8.1f} MB {result['construction_time']:>7.3f} s init")
+
+    with open(args.output, "w") as file:
+        json.dump({
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "steps": args.steps,
+            "seed": args.seed,
+            "results": results,
+        }, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
@@ -1,16 +1,92 @@
+import argparse
+import math
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.cache import ResultCache, extinction_step, run_key, source_version
+from prey_predator.meanfield import screen
 from prey_predator.model import WolfSheep
 import optuna
+from optuna.storages.journal import JournalFileBackend
 import json
 from tqdm import tqdm
 
 
 GRID_SIZE = 20
 MAX_STEPS = 10_000
+# What the study maximizes: "peaks" (number of maxima of eval_step),
+# "amplitude" or "period" (mean over both populations of the last window)
+OBJECTIVE = "peaks"
 
-def objective(trial):
+STUDY_NAME = "wolf_sheep"
+# Journal shared by all the worker processes, safe to append to concurrently
+JOURNAL_PATH = "optuna_journal.log"
+RESULTS_PATH = "results.json"
 
-    model_params = {
+# Intermediate scores are reported to the pruner every REPORT_EVERY steps
+REPORT_EVERY = 100
+# A run with no peak for this many steps is considered flat
+STAGNATION_PATIENCE = 500
+# Steps of the mean-field model a trial must survive before its agent-based
+# run, 0 to run every trial. The mean-field cycles deepen faster than the
+# ones of the agents, so only the first one is screened, with a threshold
+# far below one animal (see prey_predator.meanfield).
+SCREEN_STEPS = 100
+SCREEN_MIN_POPULATION = 1e-4
+# Trials asked from the study at once and screened together
+SCREEN_BATCH = 32
+# Base seed of the runs, trial n running with seed SEED + n: each trial is a
+# different realization of the model, so the study does not fit the noise of
+# a single one, and re-running a study reads the outcomes back from CACHE_DIR.
+# None to run each trial with fresh entropy, which disables the cache.
+SEED = 0
+CACHE_DIR = "run_cache"
+CACHE_MAX_BYTES = 1 << 30
+
+
+def make_pruner() -> optuna.pruners.BasePruner:
+    """Pruner stopping the trials whose score is below the median of the previous ones"""
+    return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=5 * REPORT_EVERY)
+
+
+def cannot_beat_best(trial: optuna.Trial, model: WolfSheep, best: float) -> bool:
+    """Whether the run is flat and has not beaten the best trial of the study so far,
+    ``best`` being the best value reported by the trial, see objective_value"""
+    if not model.oscillations.is_stagnant(STAGNATION_PATIENCE):
+        return False
+    try:
+        return best <= trial.study.best_value
+    except (AttributeError, ValueError):
+        # No study (e.g. FixedTrial) or no completed trial yet
+        return False
+
+
+def oscillation_scores(model: WolfSheep) -> dict:
+    """Period and amplitude of the oscillations in the last window of the run"""
+    oscillations = model.oscillations
+    return {
+        "sheep_period": oscillations.period(Sheep),
+        "wolf_period": oscillations.period(Wolf),
+        "sheep_amplitude": oscillations.amplitude(Sheep),
+        "wolf_amplitude": oscillations.amplitude(Wolf),
+    }
+
+
+def objective_value(scores: dict, eval: int) -> float:
+    """What the study maximizes, from the oscillation scores and the last eval_step"""
+    if OBJECTIVE == "amplitude":
+        return (scores["sheep_amplitude"] + scores["wolf_amplitude"]) / 2
+    if OBJECTIVE == "period":
+        period = (scores["sheep_period"] + scores["wolf_period"]) / 2
+        # No full oscillation in the window
+        return 0.0 if math.isnan(period) else period
+    return eval
+
+
+def suggest_params(trial: optuna.Trial) -> dict:
+    """Constructor parameters of WolfSheep suggested for a trial"""
+    return {
         "width": GRID_SIZE,
         "height": GRID_SIZE,
         "grass": True, 
@@ -27,22 +103,168 @@ def objective(trial):
         "death_age_sheep": trial.suggest_int("death_age_sheep", 0, 15),
     }
 
-    model = WolfSheep(**model_params)
+
+def trial_seed(trial: optuna.Trial):
+    """Seed of the run of a trial, None for fresh entropy if SEED is None"""
+    return None if SEED is None else SEED + trial.number
+
+
+def objective(trial, progress: bool = True):
+    """Agent-based run of the parameters suggested for a trial, unscreened"""
+    return run_trial(trial, suggest_params(trial), progress)
+
+
+def optimize(study: optuna.Study, n_trials: int, progress: bool = True) -> None:
+    """Run trials of the study, asked SCREEN_BATCH at a time so that the
+    mean-field model screens them together, and only the survivors get an
+    agent-based run"""
+    asked = 0
+    while asked < n_trials:
+        trials = [study.ask() for _ in range(min(SCREEN_BATCH, n_trials - asked))]
+        asked += len(trials)
+        params = [suggest_params(trial) for trial in trials]
+        kept = screen(params, SCREEN_STEPS, SCREEN_MIN_POPULATION) if SCREEN_STEPS else [True] * len(trials)
+        for trial, model_params, keep in zip(trials, params, kept):
+            if not keep:
+                # Scored like a run that went extinct
+                trial.set_user_attr("screened_out", True)
+                study.tell(trial, -1)
+                continue
+            try:
+                value = run_trial(trial, model_params, progress)
+            except optuna.TrialPruned:
+                study.tell(trial, state=optuna.trial.TrialState.PRUNED)
+            except Exception:
+                study.tell(trial, state=optuna.trial.TrialState.FAIL)
+                raise
+            else:
+                study.tell(trial, value)
+
+
+def run_trial(trial: optuna.Trial, model_params: dict, progress: bool = True) -> float:
+    """Agent-based run of a trial, pruned or stopped early when hopeless"""
+    seed = trial_seed(trial)
+    trial.set_user_attr("seed", seed)
+    cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR and seed is not None else None
+    outcome = None
+    if cache is not None:
+        # The stored scores also depend on the scoring code of this file
+        key = run_key(model_params, seed, "tuner", steps=MAX_STEPS,
+                      scoring=source_version(run_trial, oscillation_scores))
+        outcome = cache.get(key)
+    if outcome is not None:
+        trial.set_user_attr("cached", True)
+        for name, value in outcome.items():
+            if name not in ("eval", "Wolves", "Sheep"):
+                trial.set_user_attr(name, value)
+        return objective_value(outcome, outcome["eval"])
+
+    model = WolfSheep(**model_params, seed=seed)
 
     best = -1
-    for i in tqdm(range(MAX_STEPS)):
-        eval = model.eval_step()
+    # Best value reported so far, in the units of the study
+    best_value = -math.inf
+    # Only the runs whose end does not depend on the rest of the study are cached
+    complete = True
+    # The bar is only advanced when the trial reports, not at every step
+    progress_bar = tqdm(total=MAX_STEPS, disable=not progress, mininterval=1.0)
+    for i in range(MAX_STEPS):
+        # Scoring only needs the population history, nothing is collected
+        eval = model.eval_step(collect=False)
         if eval == -1: break
         if eval > best: best = eval
-    
-    with open("best.txt", "a") as file:
-        json.dump(model_params, file)
-        file.write(f"best eval: {best} \n\n")
 
-    return eval
+        if (i + 1) % REPORT_EVERY == 0:
+            progress_bar.update(REPORT_EVERY)
+            # The pruner and the stagnation stop compare what the study maximizes
+            value = objective_value(oscillation_scores(model), eval)
+            best_value = max(best_value, value)
+            trial.report(value, i)
+            if trial.should_prune():
+                progress_bar.close()
+                trial.set_user_attr("best_eval", best)
+                raise optuna.TrialPruned()
+            if cannot_beat_best(trial, model, best_value):
+                trial.set_user_attr("stagnated_at", i)
+                complete = False
+                break
+    progress_bar.close()
+
+    scores = oscillation_scores(model)
+    for name, value in scores.items():
+        trial.set_user_attr(name, value)
+
+    trial.set_user_attr("best_eval", best)
+
+    history = model.schedule.history
+    wolves, sheep = history.window(Wolf), history.window(Sheep)
+    # Step at which one of the populations died out, the window holding the
+    # counts at the start of the last steps, like the series of cached_run
+    extinct_at = extinction_step(wolves, sheep)
+    if extinct_at is not None:
+        extinct_at += model.schedule.steps - len(wolves)
+    trial.set_user_attr("extinct_at", extinct_at)
+    if cache is not None and complete:
+        cache.put(key, {"Wolves": wolves, "Sheep": sheep},
+                  eval=eval, best_eval=best, extinct_at=extinct_at, **scores)
+
+    return objective_value(scores, eval)
+
+def get_storage(journal_path: str) -> optuna.storages.JournalStorage:
+    return optuna.storages.JournalStorage(JournalFileBackend(journal_path))
+
+
+def run_worker(study_name: str, journal_path: str, n_trials: int) -> None:
+    """Run trials of an existing study in the current process"""
+    study = optuna.load_study(study_name=study_name, storage=get_storage(journal_path), pruner=make_pruner())
+    optimize(study, n_trials, progress=False)
+
+
+def write_results(study: optuna.Study, path: str) -> None:
+    """Dump every trial of the study to a JSON file, replaced atomically"""
+    results = [
+        {
+            "number": trial.number,
+            "state": trial.state.name,
+            "value": trial.value,
+            "params": trial.params,
+            "user_attrs": trial.user_attrs,
+        }
+        for trial in study.trials
+    ]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(results, file, indent=2)
+    os.replace(tmp_path, path)
+
 
 if __name__ == '__main__':
-    study = optuna.create_study(direction="maximize")
-    study.optimize(objective, n_trials=100)
+    parser = argparse.ArgumentParser(description="Search the parameters giving the most oscillations")
+    parser.add_argument("--trials", type=int, default=100, help="Total number of trials")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes, -1 to use all the cores")
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="Study storage shared by the workers")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON file the trials are written to")
+    args = parser.parse_args()
+
+    jobs = os.cpu_count() if args.jobs == -1 else args.jobs
+    study = optuna.create_study(study_name=STUDY_NAME,
+                                storage=get_storage(args.journal),
+                                direction="maximize",
+                                pruner=make_pruner(),
+                                load_if_exists=True)
+
+    if jobs == 1:
+        optimize(study, args.trials)
+    else:
+        # Split the trials between the workers, they share the study through the journal
+        shares = [args.trials // jobs + (i < args.trials % jobs) for i in range(jobs)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_worker, STUDY_NAME, args.journal, n_trials)
+                       for n_trials in shares if n_trials > 0]
+            for future in futures:
+                future.result()
+
+    write_results(study, args.results)
     print(study.best_trial)
 
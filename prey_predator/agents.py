@@ -1,5 +1,5 @@
 from typing import Tuple
-from mesa import Agent, Model
+from mesa import Model
 from prey_predator.random_walk import RandomWalker
 
 
@@ -10,7 +10,7 @@ class Sheep(RandomWalker):
     The init is the same as the RandomWalker.
     """
 
-    energy = None
+    __slots__ = ("energy", "age", "aging_effect", "death_age", "energy_decay_rate")
 
     def __init__(self, 
                  unique_id: int,
@@ -21,6 +21,12 @@ class Sheep(RandomWalker):
                  death_age:int = 15, 
                  energy_decay_rate:float = 1):
         super().__init__(unique_id, pos, model, moore=moore)
+        self.reset(energy, aging_effect, death_age, energy_decay_rate)
+
+    def reset(self, energy: int, aging_effect: bool, death_age: int, energy_decay_rate: float) -> None:
+        """
+            Start a new life, used when a dead sheep is recycled for a birth
+        """
         self.energy = energy
         self.age = 0
         self.aging_effect = aging_effect
@@ -38,14 +44,14 @@ class Sheep(RandomWalker):
         A model step. Move, then eat grass and reproduce.
         """
         # move : 
-        self.random_move()
+        if self.model.timed_moves:
+            self.model.event_moves(self)
+        else:
+            self.random_move()
         
         # eat :
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
-        for neighbor in cellmates:
-            if isinstance(neighbor, GrassPatch) and neighbor.fully_grown:
-                self.model.event_sheep_eats_grass(self, neighbor)
-                break
+        if self.model.grass_layer.is_grown(self.pos):
+            self.model.event_sheep_eats_grass(self)
      
         # reproduces :
         self.model.event_reproduces(self)
@@ -59,7 +65,7 @@ class Wolf(RandomWalker):
     A wolf that walks around, reproduces (asexually) and eats sheep.
     """
 
-    energy = None
+    __slots__ = ("energy", "age", "aging_effect", "death_age", "energy_decay_rate")
 
     def __init__(self,
                  unique_id: int,
@@ -71,6 +77,11 @@ class Wolf(RandomWalker):
                  death_age:int = 15,
                  energy_decay_rate: float = 1):
         super().__init__(unique_id, pos, model, moore=moore)
+        self.reset(energy, aging_effect, death_age, energy_decay_rate)
+
+    def reset(self, energy: int, aging_effect: bool, death_age: int, energy_decay_rate: float) -> None:
+        """Start a new life, used when a dead wolf is recycled for a birth
+        """
         self.energy = energy
         self.aging_effect = aging_effect
         self.age = 0
@@ -87,56 +98,19 @@ class Wolf(RandomWalker):
 
     def step(self):
         # move :
-        self.random_move()
+        if self.model.timed_moves:
+            self.model.event_moves(self)
+        else:
+            self.random_move()
 
         # reproduce :
         self.model.event_reproduces(self)
 
         # eat :
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
-        for mate in cellmates:
-            # TODO: Decide if we eat all sheeps or just some of them
-            # For me it doesn't make sense to eat all sheeps in the square
-            if isinstance(mate, Sheep):
-                self.model.event_wolf_eats_sheep(self, mate)
+        # TODO: Decide if we eat all sheeps or just some of them
+        # For me it doesn't make sense to eat all sheeps in the square
+        for sheep in self.model.grid.get_breed_contents(self.pos, Sheep):
+            self.model.event_wolf_eats_sheep(self, sheep)
     
         # Check energy, if zero --> die
         self.model.verify_survivalness(self, self.energy_decay_rate)
-
-class GrassPatch(Agent):
-    """
-    A patch of grass that grows at a fixed rate and it is eaten by sheep
-    """
-
-    def __init__(self, unique_id: int, pos: Tuple[int, int], model: Model, fully_grown: bool, countdown: int):
-        """
-        Creates a new patch of grass
-
-        Args:
-            grown: (boolean) Whether the patch of grass is fully grown or not
-            countdown: Time for the patch of grass to be fully grown again
-        """
-        super().__init__(unique_id, model)
-        self.fully_grown = fully_grown 
-        self.age = 0
-        self.time_to_grow = countdown
-        self.pos = pos
-        self.countdown = countdown
-
-    def get_eaten(self) -> None:
-        """Function to be called when the grass is eaten by a sheep
-        """
-        # reset variables
-        self.age = 0
-        self.fully_grown = False
-
-    def step(self):
-        """Function to be called at each step of the model
-        """
-        # age
-        if not self.fully_grown:
-            self.age += 1
-
-        # Check if is fully grown
-        if self.age >= self.countdown:
-            self.fully_grown=True
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Batch runs of seeded WolfSheep replicates.
+================================
+
+Expands a parameter grid, runs every (parameters, seed) pair in a process
+pool and streams the population time series of each run into a single
+long-format table, one row per run and step. With a cache directory, the
+runs already simulated with the same parameters, seed and code are read
+back from a ResultCache instead (see prey_predator.cache).
+"""
+
+import glob
+import itertools
+import os
+import shutil
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from prey_predator.cache import DEFAULT_MAX_BYTES, ResultCache, cached_run
+from prey_predator.model import WolfSheep
+
+
+def expand_grid(param_grid: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every combination of the parameter grid
+
+    Args:
+        param_grid (Dict[str, Any]): Constructor parameters of WolfSheep. Lists
+            and tuples are swept, any other value is fixed.
+    """
+    names = list(param_grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in param_grid.values()]
+    for combination in itertools.product(*values):
+        yield dict(zip(names, combination))
+
+
+def run_replicate(task: Tuple[int, Dict[str, Any], int, int, Optional[str], Optional[ResultCache]]) -> Dict[str, Any]:
+    """Run a single seeded model
+
+    Args:
+        task: (run_id, parameters, seed, number of steps, output directory,
+            result cache). With an output directory, the series are streamed
+            to its run_id=<run_id> partition instead of being returned and
+            the cache is not used.
+
+    Returns:
+        Dict[str, Any]: The task and the population series of the run
+    """
+    run_id, params, seed, steps, output_dir, cache = task
+    if output_dir is not None:
+        model = WolfSheep(**params, seed=seed, data_path=os.path.join(output_dir, f"run_id={run_id}"))
+        model.datacollector.constants.update(params, seed=seed)
+        model.run_model(steps)
+        return {"run_id": run_id}
+
+    outcome = cached_run(params, seed, steps, cache)
+    return {
+        "run_id": run_id,
+        "params": params,
+        "seed": seed,
+        "Wolves": np.asarray(outcome["Wolves"]),
+        "Sheep": np.asarray(outcome["Sheep"]),
+    }
+
+
+def batch_run(
+    param_grid: Dict[str, Any],
+    seeds: Union[int, Sequence[int]] = 1,
+    steps: int = 200,
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    output_dir: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Union[pd.DataFrame, "pyarrow.dataset.Dataset"]:
+    """Run seeded replicates of every combination of the parameter grid
+
+    Args:
+        param_grid (Dict[str, Any]): Constructor parameters, lists are swept
+        seeds (Union[int, Sequence[int]]): Seeds of the replicates, or their
+            number (seeds 0 to seeds - 1)
+        steps (int): Number of steps of each run
+        processes (Optional[int]): Size of the process pool, all the cores if
+            None, 1 to run in the current process
+        chunksize (Optional[int]): Number of runs sent at once to a worker
+        output_dir (Optional[str]): If given, every run streams its series to a
+            Parquet dataset partitioned by run_id in this directory, and the
+            dataset is returned instead of a DataFrame. The partitions of a
+            previous batch in this directory are deleted first.
+        cache_dir (Optional[str]): If given, directory of a ResultCache the
+            runs are read from and stored to
+        cache_max_bytes (int): Size bound of the cache
+
+    Returns:
+        pd.DataFrame: One row per run and step with the run id, the swept
+            parameters, the seed and the Wolves/Sheep counts
+    """
+    if isinstance(seeds, int):
+        seeds = range(seeds)
+    cache = ResultCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    tasks = [
+        (run_id, params, seed, steps, output_dir, cache)
+        for run_id, (params, seed) in enumerate(itertools.product(expand_grid(param_grid), seeds))
+    ]
+    swept = [name for name, value in param_grid.items() if isinstance(value, (list, tuple))]
+    if output_dir is not None:
+        for partition in glob.glob(os.path.join(output_dir, "run_id=*")):
+            shutil.rmtree(partition)
+
+    columns: Dict[str, List[np.ndarray]] = {name: [] for name in ["run_id", "seed", "step", *swept, "Wolves", "Sheep"]}
+
+    def collect(result: Dict[str, Any]) -> None:
+        if output_dir is not None:
+            return
+        n = len(result["Wolves"])
+        columns["run_id"].append(np.full(n, result["run_id"]))
+        columns["seed"].append(np.full(n, result["seed"]))
+        columns["step"].append(np.arange(n))
+        for name in swept:
+            columns[name].append(np.full(n, result["params"][name]))
+        columns["Wolves"].append(result["Wolves"])
+        columns["Sheep"].append(result["Sheep"])
+
+    if processes == 1:
+        for task in tasks:
+            collect(run_replicate(task))
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count())))
+        with Pool(processes) as pool:
+            for result in pool.imap_unordered(run_replicate, tasks, chunksize=chunksize):
+                collect(result)
+
+    if output_dir is not None:
+        import pyarrow.dataset as ds
+        return ds.dataset(output_dir, format="parquet", partitioning="hive")
+
+    df = pd.DataFrame({name: np.concatenate(arrays) if arrays else [] for name, arrays in columns.items()})
+    return df.sort_values(["run_id", "step"], ignore_index=True)
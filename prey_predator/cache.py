@@ -0,0 +1,209 @@
+"""
+On-disk cache of WolfSheep run outcomes.
+================================
+
+A seeded run is a pure function of the constructor parameters, the seed, the
+number of steps and the code of the model, so the tuner and the analyses
+re-simulating the same configuration can read its outcome back instead. A
+run without a seed draws fresh entropy and is never cached. An
+entry is stored under a hash of all of these and of the kind of outcome
+(see run_key), e.g. "series" for the full population series of cached_run,
+as two files:
+
+    - ``<key>.npy``: the population series, one column per series, read back
+      memory-mapped so that a hit costs no more than opening the file
+    - ``<key>.json``: the names of the series and the scalar outcomes (score,
+      extinction step...), written last so that its presence marks a
+      complete entry
+
+The cache is bounded in size: once the entries exceed ``max_bytes``, the
+least recently used ones are deleted, a hit refreshing the modification
+time of its entry. Entries are written atomically, so that processes
+sharing a cache directory never read a partial entry.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from prey_predator.model import WolfSheep
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+@functools.lru_cache(maxsize=None)
+def code_version() -> str:
+    """Hash of the sources of the prey_predator package, which changes
+    whenever the rules of the model may have"""
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(package_dir, name), "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def source_version(*functions) -> str:
+    """Hash of the source of functions outside the package whose code the
+    outcomes depend on, e.g. the scoring of a tuner"""
+    digest = hashlib.sha256()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+
+def run_key(params: Dict[str, Any], seed: int, kind: str, **extra) -> str:
+    """Key of the entry of a seeded run
+
+    Args:
+        params (Dict[str, Any]): Constructor parameters of WolfSheep
+        seed (int): Seed of the run, not None as an unseeded run has no
+            reproducible outcome
+        kind (str): What is stored for the run, entries of different kinds
+            never sharing a key
+        **extra: Anything else the outcome depends on, e.g. the number of steps
+
+    Returns:
+        str: Hex digest of the parameters, the seed, the kind, the extras and
+            the code version
+    """
+    if seed is None:
+        raise ValueError("An unseeded run has no reproducible outcome to cache")
+    description = {"params": params, "seed": seed, "kind": kind, "extra": extra, "code": code_version()}
+    # Parameters may hold numpy scalars, whose repr is not stable across versions
+    encoded = json.dumps(description, sort_keys=True, default=lambda value: value.item())
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def extinction_step(wolves: np.ndarray, sheep: np.ndarray) -> Optional[int]:
+    """Index of the first count at which one of the populations is extinct,
+    None if neither is. For series counted at the start of each step from
+    step 0, like the data collector's, it is the step of the extinction."""
+    extinct = np.flatnonzero((wolves == 0) | (sheep == 0))
+    return int(extinct[0]) if extinct.size else None
+
+
+class ResultCache:
+    """
+    Size-bounded directory of run outcomes, evicted least recently used first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory (str): Directory of the entries, created if missing
+            max_bytes (int): Total size of the entries above which the least
+                recently used ones are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, key: str):
+        """Series and metadata files of an entry"""
+        base = os.path.join(self.directory, key)
+        return f"{base}.npy", f"{base}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Outcome of a run, None if it is not cached
+
+        Returns:
+            Optional[Dict[str, Any]]: The scalars of the entry, and each of its
+                series as a read-only memory-mapped array
+        """
+        series_path, meta_path = self.paths(key)
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            series = np.load(series_path, mmap_mode="r")
+            # The entry becomes the most recently used one
+            os.utime(meta_path)
+        except (FileNotFoundError, ValueError):
+            # Missing, evicted meanwhile or unreadable
+            return None
+        outcome = dict(meta["values"])
+        for column, name in enumerate(meta["series"]):
+            outcome[name] = series[:, column]
+        return outcome
+
+    def put(self, key: str, series: Dict[str, np.ndarray], **values) -> None:
+        """Store the outcome of a run, then evict the entries above the size bound
+
+        Args:
+            key (str): Key of the run, see run_key
+            series (Dict[str, np.ndarray]): Series of the run, all of the same length
+            **values: JSON serializable scalars of the run, e.g. its score
+        """
+        series_path, meta_path = self.paths(key)
+        suffix = f".{os.getpid()}.tmp"
+        columns = np.stack([np.asarray(column, dtype=np.int64) for column in series.values()], axis=1)
+        with open(series_path + suffix, "wb") as file:
+            np.save(file, columns)
+        os.replace(series_path + suffix, series_path)
+        with open(meta_path + suffix, "w") as file:
+            json.dump({"series": list(series), "values": values}, file)
+        os.replace(meta_path + suffix, meta_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until they fit in max_bytes"""
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for item in it:
+                key, extension = os.path.splitext(item.name)
+                if extension not in (".npy", ".json"):
+                    continue
+                stat = item.stat()
+                size, used = entries.get(key, (0, 0.0))
+                # An entry is as recent as its metadata, the file refreshed on hits
+                entries[key] = (size + stat.st_size, stat.st_mtime if extension == ".json" else used)
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+            if total <= self.max_bytes:
+                break
+            for path in self.paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+def cached_run(params: Dict[str, Any], seed: Optional[int], steps: int, cache: Optional[ResultCache]) -> Dict[str, Any]:
+    """Population series of a run, read from the cache if possible
+
+    Args:
+        params (Dict[str, Any]): Constructor parameters of WolfSheep
+        seed (Optional[int]): Seed of the run, None for fresh entropy, in
+            which case the cache is neither read nor filled
+        steps (int): Number of steps
+        cache (Optional[ResultCache]): Cache to read and fill, None to always run
+
+    Returns:
+        Dict[str, Any]: The "Wolves" and "Sheep" series at the start of each
+            step and the "extinct_at" step (see extinction_step)
+    """
+    if seed is None:
+        cache = None
+    if cache is not None:
+        key = run_key(params, seed, "series", steps=steps)
+        outcome = cache.get(key)
+        if outcome is not None:
+            return outcome
+
+    model = WolfSheep(**params, seed=seed)
+    model.run_model(steps)
+    model_vars = model.datacollector.model_vars
+    wolves = np.asarray(model_vars["Wolves"], dtype=np.int64)
+    sheep = np.asarray(model_vars["Sheep"], dtype=np.int64)
+    extinct_at = extinction_step(wolves, sheep)
+    if cache is not None:
+        cache.put(key, {"Wolves": wolves, "Sheep": sheep}, extinct_at=extinct_at)
+    return {"Wolves": wolves, "Sheep": sheep, "extinct_at": extinct_at}
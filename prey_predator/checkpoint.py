@@ -0,0 +1,221 @@
+"""
+Checkpointing of WolfSheep models.
+================================
+
+A snapshot is a flat dict of NumPy arrays holding the whole state of a
+model: the animals as struct-of-arrays (from which the grid occupancy is
+rebuilt), the grass countdowns, the activation order of the scheduler,
+the random state and streams, the collected data and the population trackers.
+It is written to disk as an uncompressed ``.npz`` so that saving every N
+steps stays cheap, and a restored model continues exactly like the
+original would have.
+"""
+
+import os
+import pickle
+from typing import Dict, Optional
+
+import numpy as np
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.model import WolfSheep, gc_paused
+from prey_predator.streams import RandomStreams
+
+BREEDS = {"Sheep": Sheep, "Wolf": Wolf}
+
+Snapshot = Dict[str, np.ndarray]
+
+AGENT_COLUMNS = ("unique_id", "x", "y", "energy", "age", "death_age", "energy_decay_rate", "aging_effect", "moore")
+
+# Constructor parameters copied into each animal, by breed and column
+AGENT_PARAMS = {
+    "Sheep": {"death_age": "death_age_sheep", "energy_decay_rate": "sheep_energy_decay",
+              "aging_effect": "aging_effect", "moore": "moore"},
+    "Wolf": {"death_age": "death_age_wolf", "energy_decay_rate": "wolf_energy_decay",
+             "aging_effect": "aging_effect", "moore": "moore"},
+}
+
+
+def agents_to_arrays(agents) -> Dict[str, np.ndarray]:
+    """Struct-of-arrays view of a list of animals, off-grid ones at (-1, -1)"""
+    positions = [a.pos if a.pos is not None else (-1, -1) for a in agents]
+    return {
+        "unique_id": np.array([a.unique_id for a in agents], dtype=np.int64),
+        "x": np.array([pos[0] for pos in positions], dtype=np.int64),
+        "y": np.array([pos[1] for pos in positions], dtype=np.int64),
+        "energy": np.array([a.energy for a in agents], dtype=float),
+        "age": np.array([a.age for a in agents], dtype=np.int64),
+        "death_age": np.array([a.death_age for a in agents], dtype=np.int64),
+        "energy_decay_rate": np.array([a.energy_decay_rate for a in agents], dtype=float),
+        "aging_effect": np.array([a.aging_effect for a in agents], dtype=bool),
+        "moore": np.array([a.moore for a in agents], dtype=bool),
+    }
+
+
+def arrays_to_agents(breed: type, arrays: Dict[str, np.ndarray], model: WolfSheep):
+    """Rebuild the animals of a breed from their struct-of-arrays view"""
+    columns = [arrays[name].tolist() for name in AGENT_COLUMNS]
+    animals = []
+    for unique_id, x, y, energy, age, death_age, decay, aging_effect, moore in zip(*columns):
+        pos = (x, y) if x >= 0 else None
+        animal = breed(unique_id, pos, model, moore, energy, aging_effect, death_age, decay)
+        animal.age = age
+        animals.append(animal)
+    return animals
+
+
+def snapshot(model: WolfSheep) -> Snapshot:
+    """Capture the full state of a model
+
+    Args:
+        model (WolfSheep): Model to capture, with either engine
+
+    Returns:
+        Snapshot: Arrays describing the model, see restore
+    """
+    if model.data_path is not None:
+        model.datacollector.flush()
+
+    arrays = {"grass_countdown": model.grass_layer.countdown.copy()}
+    meta = {
+        "params": model.params,
+        "initial_sheep": model.initial_sheep,
+        "initial_wolves": model.initial_wolves,
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "current_id": model.current_id,
+        "random_state": model.random.getstate(),
+        "streams_key": model.streams.key,
+        "history": model.schedule.history,
+        "oscillations": model.oscillations,
+        "breed_order": [breed.__name__ for breed in model.schedule.queues],
+        "model_vars": list(model.datacollector.model_vars),
+        "data_path": model.data_path,
+    }
+    if model.data_path is not None:
+        # The flushed steps stay in the dataset, restore continues it
+        meta["data_parts"] = model.datacollector.num_parts
+        meta["data_buffer_steps"] = model.datacollector.buffer_steps
+
+    for name, values in model.datacollector.model_vars.items():
+        arrays[f"model_vars/{name}"] = np.asarray(values)
+    arrays["collected_steps"] = np.asarray(model.collected_steps, dtype=np.int64)
+
+    if model.engine == "numpy":
+        ecosystem = model.ecosystem
+        for name in ("x", "y", "energy", "age", "breed", "id"):
+            arrays[f"ecosystem/{name}"] = getattr(ecosystem, name).copy()
+    else:
+        # Keep the slots of each breed, tombstones dropped
+        for breed_name in meta["breed_order"]:
+            agents = model.schedule.queues[BREEDS[breed_name]].live()
+            for name, values in agents_to_arrays(agents).items():
+                arrays[f"{breed_name}/{name}"] = values
+
+    arrays["meta"] = np.frombuffer(pickle.dumps(meta), dtype=np.uint8)
+    return arrays
+
+
+def restore(arrays: Snapshot, seed: Optional[int] = None, **params) -> WolfSheep:
+    """Rebuild a model from a snapshot
+
+    Args:
+        arrays (Snapshot): Snapshot taken by ``snapshot`` or read from a checkpoint
+        seed (Optional[int]): If given, reseed the restored model instead of
+            continuing the random stream of the snapshot
+        **params: Constructor parameters replacing the ones of the snapshot, e.g.
+            data_path, or ecological rates to perturb. The ones held by each
+            animal, like death ages, are also applied to the restored animals.
+            The initial densities are ignored, the animals come from the
+            snapshot. With the data_path of the snapshot (the default), the
+            dataset is continued from the snapshot, the parts written after
+            it being replaced; another one starts a new dataset.
+
+    Returns:
+        WolfSheep: Model in the state of the snapshot
+    """
+    meta = pickle.loads(arrays["meta"].tobytes())
+    params = {name: value for name, value in params.items() if name not in ("density_sheep", "density_wolves")}
+    data_path = params.pop("data_path", meta["data_path"])
+    data_buffer_steps = params.pop("data_buffer_steps", meta.get("data_buffer_steps", 10_000))
+    # No initial population, the animals come from the snapshot
+    model = WolfSheep(**dict(meta["params"], **params, density_sheep=0, density_wolves=0))
+    if data_path is not None:
+        first_part = meta["data_parts"] if data_path == meta["data_path"] else 0
+        model.stream_data(data_path, data_buffer_steps, first_part)
+    model.initial_sheep = meta["initial_sheep"]
+    model.initial_wolves = meta["initial_wolves"]
+    model.params.update(density_sheep=meta["params"]["density_sheep"],
+                        density_wolves=meta["params"]["density_wolves"])
+
+    model.schedule.steps = meta["steps"]
+    model.schedule.time = meta["time"]
+    model.current_id = meta["current_id"]
+    model.random.setstate(meta["random_state"])
+    model.streams = RandomStreams.from_key(meta["streams_key"])
+    model.schedule.history = meta["history"]
+    model.oscillations = meta["oscillations"]
+    model.grass_layer.countdown[:] = arrays["grass_countdown"]
+    for name in meta["model_vars"]:
+        model.datacollector.model_vars[name] = arrays[f"model_vars/{name}"].tolist()
+    model.collected_steps = arrays["collected_steps"].tolist()
+
+    if model.engine == "numpy":
+        ecosystem = model.ecosystem
+        for name in ("x", "y", "energy", "age", "breed", "id"):
+            setattr(ecosystem, name, arrays[f"ecosystem/{name}"].copy())
+        ecosystem.update_counts()
+    else:
+        with gc_paused():
+            for breed_name in meta["breed_order"]:
+                breed = BREEDS[breed_name]
+                columns = {name: arrays[f"{breed_name}/{name}"] for name in AGENT_COLUMNS}
+                for column, param in AGENT_PARAMS[breed_name].items():
+                    if param in params:
+                        columns[column] = np.full_like(columns[column], params[param])
+                animals = arrays_to_agents(breed, columns, model)
+                model.schedule.add_many(animals)
+                model.grid.place_agents(animals, [animal.pos for animal in animals])
+
+    if seed is not None:
+        model.reset_randomizer(seed)
+    return model
+
+
+def save_checkpoint(model: WolfSheep, path: str) -> None:
+    """Write the state of a model to a ``.npz`` file, replaced atomically
+
+    Args:
+        model (WolfSheep): Model to save
+        path (str): Destination file
+    """
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **snapshot(model))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str, **params) -> WolfSheep:
+    """Rebuild a model from a file written by save_checkpoint
+
+    Args:
+        path (str): Checkpoint file
+        **params: See restore
+    """
+    with np.load(path) as data:
+        return restore({name: data[name] for name in data.files}, **params)
+
+
+def run_with_checkpoints(model: WolfSheep, step_count: int, path: str, every: int = 1000) -> None:
+    """Run a model, saving it to ``path`` every ``every`` steps and at the end
+
+    Args:
+        model (WolfSheep): Model to run
+        step_count (int): Number of steps to run
+        path (str): Checkpoint file, overwritten at each save
+        every (int): Number of steps between two saves
+    """
+    for i in range(step_count):
+        model.step()
+        if (i + 1) % every == 0:
+            save_checkpoint(model, path)
+    save_checkpoint(model, path)
@@ -0,0 +1,96 @@
+"""
+Streaming Parquet sink for the model variables.
+================================
+
+A DataCollector that keeps at most ``buffer_steps`` steps in memory and
+flushes them as a new Parquet part of a dataset directory, so the memory
+used by a run does not grow with its length. Requires pyarrow.
+"""
+
+import glob
+import os
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from mesa.datacollection import DataCollector
+
+
+class ParquetDataCollector(DataCollector):
+    """
+    DataCollector whose model variables are streamed to a Parquet dataset.
+
+    Each flush writes the buffered steps as one row group, in a new part file
+    of the ``path`` directory, and empties the buffer. The parts left in
+    ``path`` by a previous run are deleted, so that the dataset only holds
+    the steps of this one, but for the ones before ``first_part`` when
+    continuing the dataset of a checkpointed run. The whole history can be read back with ``get_model_vars_dataframe`` or queried lazily with
+    ``dataset``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        model_reporters=None,
+        agent_reporters=None,
+        tables=None,
+        buffer_steps: int = 10_000,
+        constants: Optional[Dict[str, Any]] = None,
+        first_part: int = 0,
+    ):
+        """
+        Args:
+            path (str): Directory of the dataset, created if needed and
+                emptied of its parts otherwise
+            model_reporters, agent_reporters, tables: Same as DataCollector
+            buffer_steps (int): Number of steps kept in memory between flushes
+            constants (Optional[Dict[str, Any]]): Columns with the same value on
+                every row, e.g. the parameters and seed of the run
+            first_part (int): Number of the first part written, the earlier
+                parts of ``path`` being kept
+        """
+        super().__init__(model_reporters, agent_reporters, tables)
+        self.path = path
+        self.buffer_steps = buffer_steps
+        self.constants = dict(constants or {})
+        self.steps = []
+        self.num_parts = first_part
+        os.makedirs(path, exist_ok=True)
+        for part in glob.glob(os.path.join(path, "part-*.parquet")):
+            if int(os.path.basename(part)[len("part-"):-len(".parquet")]) >= first_part:
+                os.remove(part)
+
+    def collect(self, model):
+        super().collect(model)
+        self.steps.append(model.schedule.steps)
+        if len(self.steps) >= self.buffer_steps:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered steps to a new part of the dataset"""
+        if not self.steps:
+            return
+        n = len(self.steps)
+        columns = {"step": pa.array(self.steps, type=pa.int64())}
+        for name, value in self.constants.items():
+            columns[name] = pa.array([value] * n)
+        for name, values in self.model_vars.items():
+            columns[name] = pa.array(values)
+        pq.write_table(pa.table(columns), os.path.join(self.path, f"part-{self.num_parts:05d}.parquet"))
+        self.num_parts += 1
+
+        self.steps = []
+        for name in self.model_vars:
+            self.model_vars[name] = []
+
+    def dataset(self) -> ds.Dataset:
+        """Lazy view of the flushed steps, which can be filtered without loading them"""
+        return ds.dataset(self.path, format="parquet")
+
+    def get_model_vars_dataframe(self):
+        self.flush()
+        if self.num_parts == 0:
+            return pd.DataFrame(columns=["step", *self.constants, *self.model_vars])
+        return self.dataset().to_table().to_pandas().sort_values("step", ignore_index=True)
@@ -0,0 +1,160 @@
+"""
+Ensembles of small Wolf-Sheep models stepped together.
+================================
+
+Running thousands of small models one at a time spends most of the time in
+per-model Python overhead (WolfSheep.step, the scheduler, one set of array
+operations per phase on a few hundred animals). An Ensemble instead stacks
+the animals and grass of every model in the same struct-of-arrays buffers,
+tagged with the index of their model, and runs each phase of the step once
+for all the models.
+
+An Ensemble is a VectorizedEcosystem whose rules run unchanged (see
+prey_predator.vectorized), each model keeping its own parameters and its own
+random streams: an animal draws its numbers by id from the counter-based
+streams of its model's seed (see prey_predator.streams), so that each model
+follows the same trajectory as a numpy-engine WolfSheep with the same
+parameters and seed, whatever the other models of the ensemble.
+"""
+
+import inspect
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from prey_predator.model import WolfSheep
+from prey_predator.streams import RandomStreams
+from prey_predator.vectorized import (MOORE_OFFSETS, SHEEP, VON_NEUMANN_OFFSETS, WOLF, VectorizedEcosystem,
+                                      initial_positions)
+
+# Constructor parameters of WolfSheep and their defaults
+DEFAULTS = {name: parameter.default
+            for name, parameter in inspect.signature(WolfSheep).parameters.items()}
+
+# Neighborhood offsets indexed by moore, the Von Neumann ones padded to the
+# size of the Moore ones
+OFFSETS = np.stack([np.concatenate([VON_NEUMANN_OFFSETS,
+                                    np.zeros((len(MOORE_OFFSETS) - len(VON_NEUMANN_OFFSETS), 2), dtype=int)]),
+                    MOORE_OFFSETS])
+NEIGHBORHOOD_SIZES = np.array([len(VON_NEUMANN_OFFSETS), len(MOORE_OFFSETS)])
+
+
+class Ensemble(VectorizedEcosystem):
+    """
+    Animals and grass of a batch of independent WolfSheep models.
+
+    Animal ``i`` belongs to model ``model_index[i]`` and stands at
+    ``(x[i], y[i])`` of its grid, its id being unique within its model. The
+    grass countdowns of every grid are concatenated in ``countdown``, model
+    ``m`` starting at ``cell_offset[m]``. The parameters are arrays with one
+    value per model, picked for each animal by for_animals, and the
+    geometry of the grids (cell_of, move) also depends on the model.
+    """
+
+    inherited = ("model_index", "x", "y", "breed")
+
+    # Steps run by every model, counted here as there is no scheduler
+    steps = 0
+
+    def __init__(self, params: Sequence[Dict[str, Any]], seeds: Optional[Sequence[int]] = None):
+        """
+        Args:
+            params (Sequence[Dict[str, Any]]): Constructor parameters of
+                WolfSheep, one dict per model, missing ones taking their
+                default value
+            seeds (Optional[Sequence[int]]): Seed of each model, fresh entropy
+                if None
+        """
+        # Unlike VectorizedEcosystem, there is no WolfSheep model to read the parameters from
+        columns = {name: np.array([p.get(name, default) for p in params])
+                   for name, default in DEFAULTS.items()}
+        if seeds is None:
+            seeds = [None] * len(params)
+        elif len(seeds) != len(params):
+            raise ValueError(f"Got {len(seeds)} seeds for {len(params)} models")
+        self.keys = np.array([RandomStreams(seed).key for seed in seeds], dtype=np.uint64).reshape(-1, 2)
+        self.models = len(params)
+
+        # Same axes as the grid of WolfSheep, whose width is the height parameter
+        self.width = columns["height"].astype(np.int64)
+        self.height = columns["width"].astype(np.int64)
+        self.moore = columns["moore"].astype(bool)
+        self.neighborhood_size = NEIGHBORHOOD_SIZES[self.moore.astype(np.int64)]
+        self.reproduce = np.stack([columns["sheep_reproduce"], columns["wolf_reproduce"]]).astype(float)
+        self.energy_decay = np.stack([columns["sheep_energy_decay"], columns["wolf_energy_decay"]]).astype(float)
+        self.death_age = np.stack([columns["death_age_sheep"], columns["death_age_wolf"]]).astype(np.int64)
+        self.aging_effect = columns["aging_effect"].astype(bool)
+        self.grass = columns["grass"].astype(bool)
+        self.sheep_gain_from_food = columns["sheep_gain_from_food"].astype(float)
+        self.wolf_gain_from_food = columns["wolf_gain_from_food"].astype(float)
+        self.regrowth_time = np.maximum(columns["grass_regrowth_time"], 1).astype(np.int64)
+
+        cells = self.width * self.height
+        self.cell_count = int(cells.sum())
+        self.cell_offset = np.concatenate([[0], np.cumsum(cells)[:-1]])
+        self.countdown = np.zeros(self.cell_count, dtype=np.int64)
+        self.grass_cells = np.repeat(self.grass, cells)
+
+        # Ids 0 to n - 1 in each model, sheep first, like the numpy engine
+        initial_sheep = (cells * columns["density_sheep"]).astype(np.int64)
+        initial = initial_sheep + (cells * columns["density_wolves"]).astype(np.int64)
+        self.model_index = np.repeat(np.arange(self.models), initial)
+        first = np.repeat(np.cumsum(initial) - initial, initial)
+        self.id = (np.arange(self.model_index.size) - first).astype(np.uint64)
+        self.breed = np.where(self.id < initial_sheep[self.model_index], SHEEP, WOLF).astype(np.int8)
+        idx = np.arange(self.model_index.size)
+        self.x, self.y = initial_positions(self.streams_of(idx), self.id,
+                                           self.for_animals(self.width, idx), self.for_animals(self.height, idx))
+        self.energy = np.ones(self.model_index.size, dtype=float)
+        self.age = np.zeros(self.model_index.size, dtype=np.int64)
+
+    def counts(self) -> np.ndarray:
+        """(models, 2) number of wolves and sheep of each model"""
+        codes = 2 * self.model_index + np.where(self.breed == WOLF, 0, 1)
+        return np.bincount(codes, minlength=2 * self.models).reshape(self.models, 2)
+
+    def for_animals(self, values, idx: np.ndarray) -> np.ndarray:
+        """Value of a parameter for each of the given animals, from the
+        (models,) array of its value in each model"""
+        return values[self.model_index[idx]]
+
+    def cell_of(self, idx: np.ndarray) -> np.ndarray:
+        """Index of the cells of the given animals in ``countdown``"""
+        model = self.model_index[idx]
+        return self.cell_offset[model] + self.x[idx] * self.height[model] + self.y[idx]
+
+    def streams_of(self, idx: np.ndarray) -> RandomStreams:
+        """Random streams of the models of the given animals, one key per animal"""
+        keys = self.keys[self.model_index[idx]]
+        return RandomStreams.from_key((keys[:, 0], keys[:, 1]))
+
+    def step(self) -> None:
+        """Advance every model by one step"""
+        self.step_sheep()
+        self.step_wolves()
+        np.subtract(self.countdown, 1, out=self.countdown, where=self.grass_cells & (self.countdown > 0))
+        self.steps += 1
+
+    def move(self, idx: np.ndarray) -> None:
+        """Step each of the given animals to a random cell of its neighborhood"""
+        model = self.model_index[idx]
+        moore = self.moore[model].astype(np.int64)
+        choice = self.choice[idx]
+        self.x[idx] = (self.x[idx] + OFFSETS[moore, choice, 0]) % self.width[model]
+        self.y[idx] = (self.y[idx] + OFFSETS[moore, choice, 1]) % self.height[model]
+
+    def run(self, step_count: int) -> Dict[str, np.ndarray]:
+        """Run every model for a number of steps
+
+        Args:
+            step_count (int): Number of steps to run
+
+        Returns:
+            Dict[str, np.ndarray]: (models, step_count) number of "Wolves" and
+                "Sheep" at the start of each step, like the data collector
+        """
+        counts = np.zeros((self.models, step_count, 2), dtype=np.int64)
+        for i in range(step_count):
+            counts[:, i] = self.counts()
+            self.step()
+        return {"Wolves": counts[:, :, 0], "Sheep": counts[:, :, 1]}
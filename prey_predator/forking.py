@@ -0,0 +1,123 @@
+"""
+Warm-start forking of a burned-in model.
+================================
+
+Runs a model once through its initial transient, keeps the resulting
+snapshot and cheaply clones it into many children with their own seeds or
+perturbed parameters, so that each trial or replicate starts directly in
+the oscillating regime.
+
+The snapshot arrays are read-only and shared by every child: in the same
+process a child only copies the arrays it mutates, and across processes
+the workers are forked so that the snapshot pages are shared copy-on-write
+instead of being pickled to each of them.
+"""
+
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from prey_predator.checkpoint import Snapshot, restore, snapshot
+from prey_predator.model import WolfSheep
+
+# Warm start inherited by the forked workers of WarmStart.map
+_shared: Optional["WarmStart"] = None
+
+
+def _set_shared(warm_start: "WarmStart") -> None:
+    global _shared
+    _shared = warm_start
+
+
+def _run_child(task) -> Any:
+    fn, seed, params = task
+    return fn(_shared.fork(seed=seed, **params))
+
+
+class WarmStart:
+    """
+    Burned-in state of a model, shared by the children forked from it.
+    """
+
+    def __init__(self, state: Snapshot):
+        """
+        Args:
+            state (Snapshot): Snapshot of the burned-in model
+        """
+        for array in state.values():
+            array.flags.writeable = False
+        self.state = state
+
+    @classmethod
+    def burn_in(cls, params: Dict[str, Any], steps: int, seed: Optional[int] = None) -> "WarmStart":
+        """Build a model and run it through its initial transient
+
+        Args:
+            params (Dict[str, Any]): Constructor parameters of WolfSheep
+            steps (int): Number of burn-in steps
+            seed (Optional[int]): Seed of the burn-in run
+        """
+        model = WolfSheep(**params, seed=seed)
+        model.run_model(steps)
+        return cls.from_model(model)
+
+    @classmethod
+    def from_model(cls, model: WolfSheep) -> "WarmStart":
+        """Share the current state of an already burned-in model"""
+        return cls(snapshot(model))
+
+    def fork(self, seed: Optional[int] = None, keep_data: bool = False, **params) -> WolfSheep:
+        """Clone the burned-in model
+
+        Args:
+            seed (Optional[int]): Seed of the child, None to continue the random
+                stream of the burn-in run
+            keep_data (bool): Whether the child keeps the data collected during
+                the burn-in, otherwise its data starts at the fork
+            **params: Constructor parameters to perturb, e.g. sheep_reproduce.
+                The child collects its data in memory unless given its own
+                data_path, the dataset of the burn-in run is left as it is.
+
+        Returns:
+            WolfSheep: Independent model in the burned-in state
+        """
+        params.setdefault("data_path", None)
+        model = restore(self.state, seed=seed, **params)
+        if not keep_data:
+            for name in model.datacollector.model_vars:
+                model.datacollector.model_vars[name] = []
+            model.collected_steps = []
+        return model
+
+    def map(
+        self,
+        fn: Callable[[WolfSheep], Any],
+        seeds: Sequence[Optional[int]],
+        params: Optional[Sequence[Dict[str, Any]]] = None,
+        processes: Optional[int] = None,
+    ) -> List[Any]:
+        """Apply a function to many children in a process pool
+
+        Args:
+            fn (Callable[[WolfSheep], Any]): Top-level function running a child
+                and returning its result
+            seeds (Sequence[Optional[int]]): Seed of each child
+            params (Optional[Sequence[Dict[str, Any]]]): Perturbed parameters of
+                each child, none by default
+            processes (Optional[int]): Size of the pool, all the cores if None
+
+        Returns:
+            List[Any]: Result of fn for each child, in order
+        """
+        if params is None:
+            params = [{}] * len(seeds)
+        tasks = [(fn, seed, child_params) for seed, child_params in zip(seeds, params)]
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            # The workers inherit the snapshot, nothing is pickled
+            _set_shared(self)
+            context = multiprocessing.get_context("fork")
+            with context.Pool(processes) as pool:
+                return pool.map(_run_child, tasks)
+
+        with multiprocessing.Pool(processes, initializer=_set_shared, initargs=(self,)) as pool:
+            return pool.map(_run_child, tasks)
@@ -0,0 +1,59 @@
+"""
+Grass layer shared by every cell of the grid.
+================================
+
+Instead of one GrassPatch agent per cell, the whole field is a 2D array of
+regrowth countdowns: a patch is fully grown when its countdown is zero, is
+reset when eaten, and all the patches regrow in a single vectorized update.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+class GrassLayer:
+    """
+    A field of grass patches that grow at a fixed rate and are eaten by sheep
+    """
+
+    def __init__(self, width: int, height: int, regrowth_time: int):
+        """
+        Creates a fully grown field of grass
+
+        Args:
+            width (int): Width of the grid
+            height (int): Height of the grid
+            regrowth_time (int): Time for a patch of grass to be fully grown again
+        """
+        self.width = width
+        self.height = height
+        # A patch eaten in a step can't be eaten again before the next one
+        self.regrowth_time = max(regrowth_time, 1)
+        self.countdown = np.zeros((width, height), dtype=np.int64)
+
+    @property
+    def fully_grown(self) -> np.ndarray:
+        """Boolean (width, height) array of the fully grown patches"""
+        return self.countdown == 0
+
+    def is_grown(self, pos: Tuple[int, int]) -> bool:
+        """Whether the patch in the given position can be eaten
+
+        Args:
+            pos (Tuple[int, int]): (x, y) position of the patch in the grid
+        """
+        return self.countdown[pos] == 0
+
+    def get_eaten(self, pos: Tuple[int, int]) -> None:
+        """Function to be called when the patch in the given position is eaten
+
+        Args:
+            pos (Tuple[int, int]): (x, y) position of the patch in the grid
+        """
+        self.countdown[pos] = self.regrowth_time
+
+    def step(self) -> None:
+        """Function to be called at each step of the model
+        """
+        np.subtract(self.countdown, 1, out=self.countdown, where=self.countdown > 0)
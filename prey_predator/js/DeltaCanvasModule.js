@@ -0,0 +1,109 @@
+/* DeltaCanvasModule.js
+ Draws a grid from the frames of DeltaCanvasGrid (prey_predator/visualization.py),
+ which hold every cell or only the cells that changed since the previous frame.
+
+ The value of a cell packs its number of wolves, its number of sheep and whether
+ its grass is grown: value = wolves << 9 | sheep << 1 | grass.
+
+ When cells are big enough they are drawn like the agent portrayals of server.py,
+ otherwise as the pixels of a heatmap which is then scaled to the canvas.
+*/
+
+var DeltaCanvasModule = function(canvas_width, canvas_height, grid_width, grid_height) {
+	// Create the element
+	// ------------------
+	var canvas_tag = `<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`;
+	var parent_div_tag = '<div style="height:' + canvas_height + 'px;" class="world-grid-parent"></div>';
+
+	var canvas = $(canvas_tag)[0];
+	var parent = $(parent_div_tag)[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+	var context = canvas.getContext("2d");
+
+	var cellWidth = canvas_width / grid_width;
+	var cellHeight = canvas_height / grid_height;
+	// Cells smaller than this, in pixels, are drawn as a heatmap
+	var MIN_SHAPE_SIZE = 8;
+	var heatmap = Math.min(cellWidth, cellHeight) < MIN_SHAPE_SIZE;
+
+	// One pixel per cell, scaled up to the canvas after each frame
+	var pixels = document.createElement("canvas");
+	pixels.width = grid_width;
+	pixels.height = grid_height;
+	var pixelContext = pixels.getContext("2d");
+	var image = pixelContext.createImageData(grid_width, grid_height);
+
+	// The y axis points up, like in CanvasGrid
+	var cellPosition = function(index) {
+		return [Math.floor(index / grid_height), grid_height - index % grid_height - 1];
+	};
+
+	var shade = function(count) {
+		return Math.max(0, 200 - 50 * count);
+	};
+
+	var cellColor = function(value) {
+		var wolves = value >> 9;
+		var sheep = (value >> 1) & 255;
+		if (wolves > 0)
+			return [255, shade(wolves), shade(wolves)];
+		if (sheep > 0)
+			return [shade(sheep), shade(sheep), 255];
+		return (value & 1) ? [0, 128, 0] : [238, 238, 238];
+	};
+
+	var drawPixel = function(index, value) {
+		var [x, y] = cellPosition(index);
+		var offset = 4 * (y * grid_width + x);
+		var color = cellColor(value);
+		image.data[offset] = color[0];
+		image.data[offset + 1] = color[1];
+		image.data[offset + 2] = color[2];
+		image.data[offset + 3] = 255;
+	};
+
+	var drawCircle = function(x, y, r, color) {
+		var radius = r * Math.min(cellWidth, cellHeight) / 2;
+		context.beginPath();
+		context.arc((x + 0.5) * cellWidth, (y + 0.5) * cellHeight, radius, 0, 2 * Math.PI);
+		context.fillStyle = color;
+		context.fill();
+	};
+
+	var drawCell = function(index, value) {
+		var [x, y] = cellPosition(index);
+		context.fillStyle = (value & 1) ? "green" : "white";
+		context.fillRect(x * cellWidth, y * cellHeight, cellWidth, cellHeight);
+		context.strokeStyle = "#eee";
+		context.strokeRect(x * cellWidth, y * cellHeight, cellWidth, cellHeight);
+		if ((value >> 1) & 255)
+			drawCircle(x, y, 0.5, "blue");
+		if (value >> 9)
+			drawCircle(x, y, 0.7, "red");
+	};
+
+	var draw = heatmap ? drawPixel : drawCell;
+
+	this.render = function(data) {
+		var values = data.values;
+		if (data.full) {
+			for (var i = 0; i < values.length; i++)
+				draw(i, values[i]);
+		} else {
+			var cells = data.cells;
+			for (var i = 0; i < cells.length; i++)
+				draw(cells[i], values[i]);
+		}
+
+		if (heatmap) {
+			pixelContext.putImageData(image, 0, 0);
+			context.imageSmoothingEnabled = false;
+			context.drawImage(pixels, 0, 0, canvas_width, canvas_height);
+		}
+	};
+
+	this.reset = function() {
+		context.clearRect(0, 0, canvas_width, canvas_height);
+	};
+};
@@ -0,0 +1,246 @@
+"""
+Live view of a simulation running independently of its viewers.
+================================
+
+With ModularServer the model only advances when a browser asks for the next
+step, inside the request handler: a slow step freezes the page and a slow
+browser slows the simulation. Here a SimulationRunner steps the model in a
+background worker thread and, at most ``max_fps`` times per second,
+publishes a frame to every subscriber. Each subscriber has a bounded queue
+holding only the latest frames: when a viewer lags behind, its stale frames
+are dropped instead of holding back the model or the other viewers.
+
+The frames are served over a websocket by a small tornado application,
+which draws them with the DeltaCanvasModule of prey_predator.visualization,
+each connection sending only what changed since the last frame it sent.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, NamedTuple, Optional, Set
+
+import numpy as np
+import tornado.web
+import tornado.websocket
+from mesa.visualization.ModularVisualization import ModularServer
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.model import WolfSheep
+from prey_predator.visualization import cell_values, frame_delta
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "templates")
+JS_PATH = os.path.join(os.path.dirname(__file__), "js")
+
+
+class Frame(NamedTuple):
+    """State of the model published to the viewers"""
+    step: int
+    wolves: int
+    sheep: int
+    values: np.ndarray
+
+
+class SimulationRunner:
+    """
+    Steps a model in a background thread and publishes frames to subscribers.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable[[], WolfSheep],
+        max_fps: float = 10,
+        steps_per_second: Optional[float] = None,
+        queue_size: int = 1,
+    ):
+        """
+        Args:
+            model_factory (Callable[[], WolfSheep]): Builds the model, again on reset
+            max_fps (float): Most frames published per second
+            steps_per_second (Optional[float]): Most steps run per second, as
+                fast as possible if None
+            queue_size (int): Frames kept for a subscriber that lags behind,
+                the oldest ones being dropped
+        """
+        self.model_factory = model_factory
+        self.max_fps = max_fps
+        self.steps_per_second = steps_per_second
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        # A single worker, so that stepping and resetting never overlap
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.model = model_factory()
+        self.frame = self.render()
+
+    def render(self) -> Frame:
+        """Frame of the current state of the model"""
+        model = self.model
+        return Frame(model.schedule.steps,
+                     model.schedule.get_breed_count(Wolf),
+                     model.schedule.get_breed_count(Sheep),
+                     cell_values(model).ravel())
+
+    def advance(self) -> Frame:
+        """Step the model until the next frame is due, in the worker thread"""
+        frame_due = time.perf_counter() + 1 / self.max_fps
+        step_time = 1 / self.steps_per_second if self.steps_per_second else 0
+        while self.model.running:
+            start = time.perf_counter()
+            self.model.step()
+            if step_time:
+                time.sleep(max(0.0, step_time - (time.perf_counter() - start)))
+            if time.perf_counter() >= frame_due:
+                break
+        return self.render()
+
+    def reset(self) -> Frame:
+        """Replace the model by a new one, in the worker thread"""
+        self.model = self.model_factory()
+        return self.render()
+
+    def publish(self, frame: Frame) -> None:
+        """Hand a frame to every subscriber, dropping their stale ones"""
+        self.frame = frame
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving the frames, starting with the current one"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self.frame)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def pause(self) -> None:
+        self.resumed.clear()
+
+    def resume(self) -> None:
+        self.resumed.set()
+
+    async def request_reset(self) -> None:
+        """Reset the model between two steps and publish its first frame"""
+        loop = asyncio.get_running_loop()
+        self.publish(await loop.run_in_executor(self.executor, self.reset))
+
+    async def run(self) -> None:
+        """Step the model and publish its frames until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.resumed.wait()
+            if not self.model.running:
+                self.pause()
+                continue
+            self.publish(await loop.run_in_executor(self.executor, self.advance))
+
+
+class FrameSocketHandler(tornado.websocket.WebSocketHandler):
+    """
+    Streams the frames of a runner to one viewer, which can pause, resume or
+    reset the simulation with ``{"type": "pause" | "resume" | "reset"}``.
+
+    The viewer acknowledges each frame once drawn with ``{"type": "ack"}``,
+    and is only sent the latest frame after that, so that frames are dropped
+    on the server rather than piling up in the socket of a slow browser.
+    """
+
+    def initialize(self, runner: SimulationRunner) -> None:
+        self.runner = runner
+        self.queue = None
+        self.sender = None
+        self.acked = asyncio.Event()
+
+    def open(self) -> None:
+        self.queue = self.runner.subscribe()
+        self.acked.set()
+        self.sender = asyncio.ensure_future(self.send_frames())
+
+    async def send_frames(self) -> None:
+        shown = None
+        while True:
+            await self.acked.wait()
+            self.acked.clear()
+            frame = await self.queue.get()
+            message = {"step": frame.step, "wolves": frame.wolves, "sheep": frame.sheep,
+                       "canvas": frame_delta(shown, frame.values)}
+            shown = frame.values
+            try:
+                # Only this viewer waits for its own socket, its queue keeps the latest frame
+                await self.write_message(json.dumps(message))
+            except tornado.websocket.WebSocketClosedError:
+                return
+
+    async def on_message(self, message) -> None:
+        msg = json.loads(message)
+        if msg["type"] == "ack":
+            self.acked.set()
+        elif msg["type"] == "pause":
+            self.runner.pause()
+        elif msg["type"] == "resume":
+            self.runner.resume()
+        elif msg["type"] == "reset":
+            await self.runner.request_reset()
+
+    def on_close(self) -> None:
+        self.runner.unsubscribe(self.queue)
+        if self.sender is not None:
+            self.sender.cancel()
+
+    def check_origin(self, origin) -> bool:
+        return True
+
+
+class LivePageHandler(tornado.web.RequestHandler):
+    """Page drawing the frames of the runner"""
+
+    def initialize(self, runner: SimulationRunner, canvas_size: int) -> None:
+        self.runner = runner
+        self.canvas_size = canvas_size
+
+    def get(self) -> None:
+        grid = self.runner.model.grid
+        self.render("live.html", grid_width=grid.width, grid_height=grid.height,
+                    canvas_size=self.canvas_size)
+
+
+def make_app(runner: SimulationRunner, canvas_size: int = 600) -> tornado.web.Application:
+    """Tornado application serving the live view of a runner"""
+    return tornado.web.Application(
+        [
+            (r"/", LivePageHandler, {"runner": runner, "canvas_size": canvas_size}),
+            (r"/frames", FrameSocketHandler, {"runner": runner}),
+            (r"/js/(.*)", tornado.web.StaticFileHandler, {"path": JS_PATH}),
+            # jQuery, from the templates of Mesa's own server
+            ModularServer.static_handler,
+        ],
+        template_path=TEMPLATE_PATH,
+    )
+
+
+async def serve(runner: SimulationRunner, port: int = 8521) -> None:
+    """Serve the live view of a runner while it steps its model"""
+    make_app(runner).listen(port)
+    print(f"Interface starting at http://127.0.0.1:{port}")
+    await runner.run()
+
+
+def launch(model_params: Dict, port: int = 8521, **runner_args) -> None:
+    """Run a WolfSheep model and its live view until interrupted
+
+    Args:
+        model_params (Dict): Constructor parameters of WolfSheep
+        port (int): Port of the web page
+        **runner_args: See SimulationRunner
+    """
+    async def main():
+        await serve(SimulationRunner(lambda: WolfSheep(**model_params), **runner_args), port)
+
+    asyncio.run(main())
@@ -0,0 +1,273 @@
+"""
+Mean-field approximation of the Wolf-Sheep model.
+================================
+
+Replaces the animals by expected numbers of animals in each (age, energy)
+class, and the grass by the fraction of cells at each regrowth countdown,
+assuming the animals are spread uniformly and independently over the grid
+(Poisson occupancy of the cells). Each step applies the rules of WolfSheep in
+the same order, sheep before wolves:
+
+    - a sheep eats when its cell has grown grass and no other sheep ate it
+      first, a wolf eats every sheep of its cell if it is the first wolf there
+    - a parent gives birth with its reproduction probability, the child
+      starting with half the parent's energy
+    - an animal whose energy is exactly 0 dies, then it ages (and may reach
+      its death age) and spends its energy decay
+
+Many parameter sets are integrated at once along a batch axis, a set being
+dropped from the batch as soon as one of its populations collapses, so that
+these sets can be discarded for a fraction of the cost of an agent-based run
+(see screen). This is milliseconds rather than microseconds per set: a batch
+of 256 sets of the tuner's space takes about 1.3 s for the 100 steps of
+screen, i.e. about 5 ms per set, most of it shifting the energy classes,
+where a 500-step numpy-engine run of one of these sets takes about 350 ms.
+
+Without the spatial effects that damp the oscillations of the agents, the
+mean-field cycles grow and their troughs get deeper at each cycle, so only
+the first cycle is a reliable guide: the defaults of screen were calibrated
+so that no parameter set whose agents survive is rejected. On 1600 sets of
+the tuner's space (two seeded 500-step numpy-engine runs each), 100 steps
+and a threshold of 1e-4 kept all of the 121 surviving sets, the closest one
+being 76 times above the threshold, and rejected 63% of the others.
+
+Energies live on an integer grid, from -MIN_ENERGY to MAX_ENERGY, the
+classes beyond being merged into the extreme ones, and decays are rounded
+to integers.
+"""
+
+import inspect
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+from prey_predator.model import WolfSheep
+
+MIN_ENERGY = -16
+MAX_ENERGY = 64
+# Number of sheep a wolf can find in its cell, larger numbers being merged
+MAX_PREYS = 4
+
+# Constructor parameters of WolfSheep and their defaults
+DEFAULTS = {name: parameter.default
+            for name, parameter in inspect.signature(WolfSheep).parameters.items()}
+
+
+def shift_energy(n: np.ndarray, shift: np.ndarray) -> np.ndarray:
+    """Add a per-model amount to the energy of every class
+
+    Args:
+        n (np.ndarray): (models, ages, energies) expected number of animals
+        shift (np.ndarray): (models,) integer energy added in each model
+
+    Returns:
+        np.ndarray: Shifted classes, the ones leaving the grid being merged
+            into its first or last energy
+    """
+    energies = n.shape[-1]
+    # Shifts beyond the size of the grid send every class to the same end
+    shift = np.clip(shift, -energies, energies)
+    padded = np.zeros(n.shape[:-1] + (3 * energies,))
+    padded[..., energies:2 * energies] = n
+    # Window i of a model starts at energy index i - energies of its classes
+    windows = np.lib.stride_tricks.sliding_window_view(padded, energies, axis=-1)
+    shifted = windows[np.arange(len(n)), :, energies - shift]
+
+    # What went past the last energy when adding, past the first when subtracting
+    outside = n.sum(axis=-1) - shifted.sum(axis=-1)
+    shifted[:, :, -1] += np.where((shift > 0)[:, None], outside, 0.0)
+    shifted[:, :, 0] += np.where((shift < 0)[:, None], outside, 0.0)
+    return shifted
+
+
+class MeanFieldBatch:
+    """
+    Expected populations of a batch of Wolf-Sheep models.
+
+    ``sheep`` and ``wolves`` are (models, ages, energies) arrays of expected
+    numbers of animals, energy index ``i`` standing for ``MIN_ENERGY + i``.
+    ``grass`` is the (models, countdowns) fraction of cells at each regrowth
+    countdown, 0 being fully grown.
+    """
+
+    def __init__(self, params: Sequence[Dict[str, Any]]):
+        """
+        Args:
+            params (Sequence[Dict[str, Any]]): Constructor parameters of
+                WolfSheep, one dict per model, missing ones taking their
+                default value
+        """
+        columns = {name: np.array([p.get(name, default) for p in params])
+                   for name, default in DEFAULTS.items()}
+        models = len(params)
+        self.cells = (columns["height"] * columns["width"]).astype(float)
+        self.grass_enabled = columns["grass"].astype(bool)
+        self.reproduce = {"sheep": columns["sheep_reproduce"], "wolves": columns["wolf_reproduce"]}
+        self.sheep_gain = np.where(self.grass_enabled, columns["sheep_gain_from_food"], 1).astype(np.int64)
+        self.wolf_gain = columns["wolf_gain_from_food"].astype(np.int64)
+        self.decay = {"sheep": np.rint(columns["sheep_energy_decay"]).astype(np.int64),
+                      "wolves": np.rint(columns["wolf_energy_decay"]).astype(np.int64)}
+        # A death age below 1 is never reached, the age is checked after being incremented
+        aging = columns["aging_effect"].astype(bool)
+        self.death_age = {
+            "sheep": np.where(aging & (columns["death_age_sheep"] >= 1), columns["death_age_sheep"], 0),
+            "wolves": np.where(aging & (columns["death_age_wolf"] >= 1), columns["death_age_wolf"], 0),
+        }
+        # Ages up to the largest death age included, where animals are removed
+        ages = int(max(self.death_age["sheep"].max(), self.death_age["wolves"].max())) + 1
+
+        energies = MAX_ENERGY - MIN_ENERGY + 1
+        self.energy = np.arange(MIN_ENERGY, MAX_ENERGY + 1)
+        self.starving = -MIN_ENERGY
+        # children[i, j] is 1 when a parent of energy class i has a child of class j
+        self.children = np.zeros((energies, energies))
+        self.children[np.arange(energies), self.energy // 2 - MIN_ENERGY] = 1
+
+        # Every animal starts with an energy of 1
+        self.sheep = np.zeros((models, ages, energies))
+        self.wolves = np.zeros((models, ages, energies))
+        self.sheep[:, 0, 1 - MIN_ENERGY] = np.floor(self.cells * columns["density_sheep"])
+        self.wolves[:, 0, 1 - MIN_ENERGY] = np.floor(self.cells * columns["density_wolves"])
+
+        self.regrowth = np.maximum(columns["grass_regrowth_time"], 1).astype(np.int64)
+        self.grass = np.zeros((models, int(self.regrowth.max()) + 1))
+        self.grass[:, 0] = 1
+
+    def counts(self) -> np.ndarray:
+        """(models, 2) expected number of wolves and sheep"""
+        return np.stack([self.wolves.sum(axis=(1, 2)), self.sheep.sum(axis=(1, 2))], axis=1)
+
+    def step(self) -> None:
+        """Advance every model by one step"""
+        self.step_sheep()
+        self.step_wolves()
+        if self.grass_enabled.any():
+            self.step_grass()
+
+    def step_sheep(self) -> None:
+        n = self.sheep
+        density = n.sum(axis=(1, 2)) / self.cells
+        # Expected fraction of the sheep first on a cell with grown grass
+        with np.errstate(invalid="ignore", divide="ignore"):
+            first = np.where(density > 0, -np.expm1(-density) / density, 1.0)
+        eat = np.where(self.grass_enabled, self.grass[:, 0] * first, 1.0)
+        n = (1 - eat)[:, None, None] * n + eat[:, None, None] * shift_energy(n, self.sheep_gain)
+
+        eaten_cells = np.where(self.grass_enabled, self.grass[:, 0] * -np.expm1(-density), 0.0)
+        self.grass[:, 0] -= eaten_cells
+        self.grass[np.arange(len(self.grass)), self.regrowth] += eaten_cells
+
+        births = self.birth_energies(n, self.reproduce["sheep"])
+        n = self.survive(n, "sheep")
+        n[:, 0] += births
+        self.sheep = n
+
+    def step_wolves(self) -> None:
+        n = self.wolves
+        births = self.birth_energies(n, self.reproduce["wolves"])
+
+        wolf_density = n.sum(axis=(1, 2)) / self.cells
+        sheep_density = self.sheep.sum(axis=(1, 2)) / self.cells
+        # A wolf eats when first on its cell, the number of sheep it finds
+        # being Poisson distributed
+        with np.errstate(invalid="ignore", divide="ignore"):
+            first = np.where(wolf_density > 0, -np.expm1(-wolf_density) / wolf_density, 1.0)
+        preys = np.arange(1, MAX_PREYS + 1)
+        log_factorial = np.cumsum(np.log(preys))
+        p_preys = np.exp(-sheep_density[:, None] + preys * np.log(np.maximum(sheep_density, 1e-300))[:, None]
+                         - log_factorial)
+        p_preys[:, -1] = np.maximum(0.0, -np.expm1(-sheep_density) - p_preys[:, :-1].sum(axis=1))
+
+        # Classes after eating k sheep, all k shifted at once along the model axis
+        gains = shift_energy(np.tile(n, (MAX_PREYS, 1, 1)), np.outer(preys, self.wolf_gain).ravel())
+        fed = np.einsum("mk,kmae->mae", p_preys, gains.reshape((MAX_PREYS,) + n.shape))
+        eat = first * -np.expm1(-sheep_density)
+        n = (1 - eat)[:, None, None] * n + first[:, None, None] * fed
+        # Every sheep sharing a cell with a wolf is eaten
+        self.sheep *= np.exp(-wolf_density)[:, None, None]
+
+        n = self.survive(n, "wolves")
+        n[:, 0] += births
+        self.wolves = n
+
+    def step_grass(self) -> None:
+        grass = self.grass
+        grass[:, 0] += grass[:, 1]
+        grass[:, 1:-1] = grass[:, 2:]
+        grass[:, -1] = 0
+
+    def birth_energies(self, n: np.ndarray, reproduce: np.ndarray) -> np.ndarray:
+        """(models, energies) expected newborns, by energy"""
+        return (reproduce[:, None] * n.sum(axis=1)) @ self.children
+
+    def survive(self, n: np.ndarray, breed: str) -> np.ndarray:
+        """Remove the starving animals, age the others and spend their energy"""
+        n = n.copy()
+        n[:, :, self.starving] = 0
+
+        death_age = self.death_age[breed]
+        aged = np.zeros_like(n)
+        aged[:, 1:] = n[:, :-1]
+        aged[np.arange(len(n)), death_age] *= (death_age == 0)[:, None]
+        n = np.where((death_age > 0)[:, None, None], aged, n)
+        return shift_energy(n, -self.decay[breed])
+
+    def keep(self, models: np.ndarray) -> None:
+        """Drop every model of the batch but the given ones
+
+        Args:
+            models (np.ndarray): Indices of the models to keep
+        """
+        for name in ("cells", "grass_enabled", "sheep_gain", "wolf_gain", "sheep", "wolves", "regrowth", "grass"):
+            setattr(self, name, getattr(self, name)[models])
+        for rates in (self.reproduce, self.decay, self.death_age):
+            for breed in rates:
+                rates[breed] = rates[breed][models]
+
+    def run(self, step_count: int, min_population: float = 1.0) -> np.ndarray:
+        """Integrate every model for a number of steps
+
+        Like a tuner trial, a model stops at the first step where its wolves
+        or its sheep are extinct and is dropped from the batch, which keeps
+        the cost of screening proportional to the models still alive.
+
+        Args:
+            step_count (int): Number of steps
+            min_population (float): Expected population under which a breed is
+                considered extinct
+
+        Returns:
+            np.ndarray: (models, step_count, 2) expected number of wolves and
+                sheep at the start of each step, like the data collector,
+                0 from the extinction of a model on
+        """
+        counts = np.zeros((len(self.cells), step_count, 2))
+        alive = np.arange(len(self.cells))
+        for i in range(step_count):
+            current = self.counts()
+            extinct = (current < min_population).any(axis=1)
+            current[extinct] = 0
+            counts[alive, i] = current
+            if extinct.any():
+                self.keep(np.flatnonzero(~extinct))
+                alive = alive[~extinct]
+                if alive.size == 0:
+                    break
+            self.step()
+        return counts
+
+
+def screen(params: Sequence[Dict[str, Any]], step_count: int = 100, min_population: float = 1e-4) -> np.ndarray:
+    """Which parameter sets keep both populations alive in the mean-field model
+
+    Args:
+        params (Sequence[Dict[str, Any]]): Constructor parameters of WolfSheep
+        step_count (int): Number of steps integrated
+        min_population (float): Expected population under which a breed is
+            considered extinct
+
+    Returns:
+        np.ndarray: (models,) boolean mask of the surviving parameter sets
+    """
+    counts = MeanFieldBatch(params).run(step_count, min_population)
+    return (counts[:, -1] > 0).all(axis=1)
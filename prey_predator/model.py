@@ -9,14 +9,46 @@ Replication of the model found in NetLogo:
     Northwestern University, Evanston, IL.
 """
 
-from typing import Tuple, Union
+import gc
+import random
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
 from mesa import Model
-from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
 
-from prey_predator.agents import Sheep, Wolf, GrassPatch
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.grass import GrassLayer
+from prey_predator.oscillation import OscillationTracker
+from prey_predator.pool import AgentPool
+from prey_predator.profiling import PhaseProfiler
 from prey_predator.schedule import RandomActivationByBreed
-from scipy.signal import find_peaks 
+from prey_predator.space import BreedIndexedGrid
+from prey_predator.streams import RandomStreams
+from prey_predator.vectorized import VectorizedEcosystem, initial_positions
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic garbage collector while allocating many long-lived agents,
+    it would otherwise scan them over and over for cycles"""
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+MODEL_REPORTERS = {
+    "Wolves": lambda m: m.schedule.get_breed_count(Wolf),
+    "Sheep": lambda m: m.schedule.get_breed_count(Sheep),
+}
+TABLES = {
+    "Count": ["Wolves", "Sheep"],
+}
 
 
 class WolfSheep(Model):
@@ -61,6 +93,11 @@ class WolfSheep(Model):
         sheep_energy_decay: float = 1,
         wolf_energy_decay: float = 1,
         moore: bool = False,
+        engine: str = "agents",
+        seed: int = None,
+        data_path: str = None,
+        data_buffer_steps: int = 10_000,
+        profile: bool = False,
     ):
         """
         Create a new Wolf-Sheep model with the given parameters.
@@ -76,8 +113,33 @@ class WolfSheep(Model):
                                  once it is eaten
             sheep_gain_from_food: Energy sheep gain from grass, if enabled.
             aging_effect: Whether or not to apply an aging effect to animals
+            engine: "agents" to step one Python agent at a time, or "numpy" to
+                    step all the animals at once in struct-of-arrays buffers
+            seed: Seed of the model's random streams, see prey_predator.streams
+            data_path: If given, directory the collected data is streamed to as
+                       Parquet instead of being kept in memory
+            data_buffer_steps: Number of steps buffered between two writes to
+                               data_path
+            profile: Whether to time each phase of the step, see
+                     prey_predator.profiling
         """
         super().__init__()
+        # Mesa stores the generator on the class, each model needs its own
+        self._seed = seed
+        self.random = random.Random(seed)
+        # Every draw of a run is addressed by purpose, step, breed and animal
+        self.streams = RandomStreams(seed)
+        # Ecological parameters, enough to build a model with the same rules
+        self.params = dict(height=height, width=width,
+                           density_sheep=density_sheep, density_wolves=density_wolves,
+                           sheep_reproduce=sheep_reproduce, wolf_reproduce=wolf_reproduce,
+                           wolf_gain_from_food=wolf_gain_from_food,
+                           grass=grass, grass_regrowth_time=grass_regrowth_time,
+                           sheep_gain_from_food=sheep_gain_from_food,
+                           aging_effect=aging_effect,
+                           death_age_wolf=death_age_wolf, death_age_sheep=death_age_sheep,
+                           sheep_energy_decay=sheep_energy_decay, wolf_energy_decay=wolf_energy_decay,
+                           moore=moore, engine=engine)
         # Set parameters
         self.height = height
         self.width = width
@@ -91,109 +153,237 @@ class WolfSheep(Model):
         self.sheep_gain_from_food = sheep_gain_from_food
         self.aging_effect = aging_effect
         self.moore = moore
-
-        self.schedule = RandomActivationByBreed(self)
-        self.grid = MultiGrid(self.height, self.width, torus=True)
-        self.datacollector = DataCollector(
-            model_reporters=
-            {
-                "Wolves": lambda m: m.schedule.get_breed_count(Wolf),
-                "Sheep": lambda m: m.schedule.get_breed_count(Sheep),
-            },
-            tables={
-                "Count": ["Wolves", "Sheep"],
-            }
-        )
+        if engine not in ("agents", "numpy"):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+
+        self.schedule = RandomActivationByBreed(self, history_breeds=(Wolf, Sheep))
+        self.pool = AgentPool()
+        self.grid = BreedIndexedGrid(self.height, self.width, torus=True)
+        self.grass_layer = GrassLayer(self.grid.width, self.grid.height, self.grass_regrowth_time)
+        self.oscillations = OscillationTracker((Wolf, Sheep), window=100)
+        self.data_path = data_path
+        self.collected_steps = []
+        if data_path is None:
+            self.datacollector = DataCollector(model_reporters=MODEL_REPORTERS, tables=TABLES)
+        else:
+            self.stream_data(data_path, data_buffer_steps)
 
         self.sheep_initial_energy = sheep_gain_from_food
-        # Create sheep:
-        for i in range(self.initial_sheep):
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.create_sheep(pos = (x,y),
-                              moore = self.moore,
-                              energy = 1, 
-                              aging_effect = aging_effect,
-                              death_age = death_age_sheep,
-                              energy_decay=sheep_energy_decay
-                              )
-
         self.wolf_initial_energy = wolf_gain_from_food
-        # Create wolves
-        for i in range(self.initial_wolves):
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.create_wolf(pos = (x,y),
-                             moore = self.moore,
-                             energy=1, 
-                             aging_effect=aging_effect,  
-                             death_age=death_age_wolf,
-                             energy_decay=wolf_energy_decay )
-
-        # Create grass patches
-        for i in range(width):
-            for j in range(height):
-                self.create_grass((i, j))
-   
-    def create_grass(self, pos: Tuple[int, int]): 
-        """Create a GrassPatch in the specified position
+
+        # The numpy engine keeps its own animals, no agent is created
+        if self.engine == "numpy":
+            self.ecosystem = VectorizedEcosystem(self,
+                                                 initial_sheep=self.initial_sheep,
+                                                 initial_wolves=self.initial_wolves,
+                                                 death_age_sheep=death_age_sheep,
+                                                 death_age_wolf=death_age_wolf,
+                                                 sheep_energy_decay=sheep_energy_decay,
+                                                 wolf_energy_decay=wolf_energy_decay)
+        else:
+            self.create_animals(death_age_sheep, death_age_wolf, sheep_energy_decay, wolf_energy_decay)
+
+        # Whether the animals move through event_moves, which the profiler times
+        self.timed_moves = False
+        self.profiler = PhaseProfiler().attach(self) if profile else None
+
+    def create_animals(self, death_age_sheep: int, death_age_wolf: int, sheep_energy_decay: float, wolf_energy_decay: float):
+        """Create the initial sheep and wolves at random positions of the grid
+
+        All the positions are drawn at once, the same as the numpy engine's,
+        each breed gets a range of ids and is added to the grid and the
+        schedule in bulk.
+        """
+        ids = np.arange(self.initial_sheep + self.initial_wolves, dtype=np.uint64)
+        xs, ys = initial_positions(self.streams, ids, self.grid.width, self.grid.height)
+        positions = list(zip(xs.tolist(), ys.tolist()))
+        with gc_paused():
+            self.create_many(Sheep, positions[:self.initial_sheep], death_age_sheep, sheep_energy_decay)
+            self.create_many(Wolf, positions[self.initial_sheep:], death_age_wolf, wolf_energy_decay)
+
+    def create_many(self, breed: type, positions: List[Tuple[int, int]], death_age: int, energy_decay: float):
+        """Create animals of a breed at the given positions, with an energy of 1
 
         Args:
-            pos Tuple[int, int]: (x, y) position of the grass in the Grid
+            breed (type): Sheep or Wolf
+            positions (List[Tuple[int, int]]): Position of each animal
+            death_age (int): Age at which the animals die, if aging is enabled
+            energy_decay (float): Energy lost by the animals at each step
         """
-        (i, j) = pos
-        new_grass = GrassPatch(self.next_id(), (i, j), self, True, self.grass_regrowth_time)
-        self.schedule.add(new_grass)
-        self.grid.place_agent(new_grass, (i, j))
+        n = len(positions)
+        first_id = self.current_id + 1
+        self.current_id += n
+
+        animals = [breed(unique_id, pos, self, self.moore, 1, self.aging_effect, death_age, energy_decay)
+                   for unique_id, pos in zip(range(first_id, first_id + n), positions)]
+        self.schedule.add_many(animals)
+        self.grid.place_agents(animals, positions)
 
     def create_sheep(self, pos: Tuple[int, int], moore: bool, energy: int, aging_effect: bool, death_age: int, energy_decay: float):
-        new_sheep = Sheep(self.next_id(), pos, self, moore, energy, aging_effect, death_age, energy_decay_rate=energy_decay)
+        new_sheep = self.pool.acquire(Sheep)
+        if new_sheep is None:
+            new_sheep = Sheep(self.next_id(), pos, self, moore, energy, aging_effect, death_age, energy_decay_rate=energy_decay)
+        else:
+            # A new id, so that the run does not depend on what the pool holds
+            new_sheep.unique_id = self.next_id()
+            new_sheep.moore = moore
+            new_sheep.reset(energy, aging_effect, death_age, energy_decay)
         self.schedule.add(new_sheep)
         self.grid.place_agent(new_sheep, pos)
 
     def create_wolf(self, pos: Tuple[int, int], moore: bool, energy: int, aging_effect: bool, death_age: int, energy_decay: float):
-        new_wolf = Wolf(self.next_id(), pos, self, moore, energy, aging_effect, death_age, energy_decay_rate=energy_decay)
+        new_wolf = self.pool.acquire(Wolf)
+        if new_wolf is None:
+            new_wolf = Wolf(self.next_id(), pos, self, moore, energy, aging_effect, death_age, energy_decay_rate=energy_decay)
+        else:
+            new_wolf.unique_id = self.next_id()
+            new_wolf.moore = moore
+            new_wolf.reset(energy, aging_effect, death_age, energy_decay)
         self.schedule.add(new_wolf)
         self.grid.place_agent(new_wolf, pos)
 
+    def reset_randomizer(self, seed: Optional[int] = None) -> None:
+        """Reseed the model, its random streams included
+
+        Args:
+            seed (Optional[int]): New seed, the current one if None
+        """
+        super().reset_randomizer(seed)
+        self.streams = RandomStreams(self._seed)
+
     def kill_animal(self, animal: Union[Sheep, Wolf]) -> None:
         self.grid.remove_agent(animal)
         self.schedule.remove(animal)
+        self.pool.release(animal)
 
-    def step(self):
+    def step(self, collect: bool = True):
+        """Advance the model by one step
 
+        Args:
+            collect (bool): Whether to collect the data of the step, the
+                population history and oscillations are always updated
+        """
         # Collect data
-        self.datacollector.collect(self)
+        if collect:
+            self.collect()
+        self.schedule.record_history()
+        self.oscillations.update(self.schedule.breed_counts)
         
 
         # ... to be completed
+        if self.engine == "numpy":
+            self.ecosystem.step()
         self.schedule.step()
+
+        # The grass grows after every animal has moved
+        if self.grass:
+            self.grass_layer.step()
+
+        # The animals that died during the step can be born again
+        self.pool.flush(self.schedule.breed_counts)
     
-    def eval_step(self) -> int:
-        self.step()
+    def stream_data(self, data_path: str, buffer_steps: int = 10_000, first_part: int = 0) -> None:
+        """Stream the data collected from now on to a Parquet dataset
 
-        df = self.datacollector.get_model_vars_dataframe()
-        #print(df["Wolves"].iloc[-1], df["Sheep"].iloc[-1])
+        Args:
+            data_path (str): Directory of the dataset
+            buffer_steps (int): Number of steps buffered between two writes
+            first_part (int): Number of the first part written, the earlier
+                parts of the directory being kept, e.g. to continue the
+                dataset of a checkpointed run
+        """
+        # pyarrow is only needed when streaming the data
+        from prey_predator.datasink import ParquetDataCollector
+        self.data_path = data_path
+        self.datacollector = ParquetDataCollector(data_path,
+                                                  model_reporters=MODEL_REPORTERS,
+                                                  tables=TABLES,
+                                                  buffer_steps=buffer_steps,
+                                                  first_part=first_part)
+
+    def collect(self) -> None:
+        """Collect the data of the current state of the model"""
+        self.datacollector.collect(self)
+        # The Parquet collector records the step itself
+        if self.data_path is None:
+            self.collected_steps.append(self.schedule.steps)
 
-        #if df["Wolves"].iloc[-1]/df["Sheep"].iloc[-1] >= 1000 or df["Sheep"].iloc[-1]/df["Wolves"].iloc[-1] >= 1000 :
-            #return -1
+    def eval_step(self, collect: bool = True) -> int:
+        self.step(collect)
 
-        if df['Wolves'].iloc[-1] == 0 or df["Sheep"].iloc[-1] == 0:
+        history = self.schedule.history
+
+        if history.last(Wolf) == 0 or history.last(Sheep) == 0:
             return -1
         
-        num_maxima_sheep = find_peaks(df['Sheep'][-100:])[0].shape[0]
-        num_maxima_wolf = find_peaks(df['Sheep'][-100:])[0].shape[0]
+        num_maxima_sheep = self.oscillations.num_peaks(Sheep)
+        num_maxima_wolf = self.oscillations.num_peaks(Wolf)
     
         return num_maxima_wolf  + num_maxima_sheep
         
 
-    def run_model(self, step_count=200) -> None:
-        for _ in range(step_count):
-            self.step()
+    def run_model(self, step_count=200, collect: Union[int, str] = 1) -> None:
+        """Run the model for a number of steps
+
+        Args:
+            step_count (int): Number of steps to run
+            collect (Union[int, str]): How often the data is collected: every
+                ``collect`` steps if an integer, only the final state if "end",
+                or never if "summary", the population summary statistics
+                being kept either way (see summary)
+        """
+        if collect == "end" or collect == "summary":
+            for _ in range(step_count):
+                self.step(collect=False)
+            if collect == "end":
+                self.collect()
+        elif collect == 1:
+            for _ in range(step_count):
+                self.step()
+        elif isinstance(collect, int) and collect > 1:
+            for _ in range(step_count):
+                self.step(collect=self.schedule.steps % collect == 0)
+        else:
+            raise ValueError(f"Unknown collect mode: {collect}")
+
+        if self.data_path is not None:
+            self.datacollector.flush()
+
+    def summary(self) -> Dict[str, float]:
+        """Summary statistics of the populations over every step run so far
+
+        Returns:
+            Dict[str, float]: Mean, standard deviation, min and max of each
+                population, and number of peaks of their last window
+        """
+        summary = {"steps": self.schedule.steps}
+        for breed, name in ((Wolf, "wolves"), (Sheep, "sheep")):
+            for statistic, value in self.schedule.history.summary(breed).items():
+                summary[f"{name}_{statistic}"] = value
+            summary[f"{name}_peaks"] = self.oscillations.num_peaks(breed)
+        return summary
+
+    def get_model_vars_dataframe(self) -> pd.DataFrame:
+        """Collected model variables, one row per collected step
+
+        Unlike the data collector's own method, the rows are labelled by
+        step, which matters when the data was only collected every k steps.
+        """
+        if self.data_path is not None:
+            return self.datacollector.get_model_vars_dataframe().set_index("step")
+        df = self.datacollector.get_model_vars_dataframe()
+        df.index = pd.Index(self.collected_steps, name="step")
+        return df
+
+    def event_moves(self, animal: Union[Sheep, Wolf]) -> None:
+        """Animal steps to a random cell of its neighborhood, only called
+        while timed_moves is set"""
+        animal.random_move()
 
-    def event_sheep_eats_grass(self, sheep: Sheep, grass: GrassPatch) -> None:
+    def event_sheep_eats_grass(self, sheep: Sheep) -> None:
         if self.grass:
-            grass.get_eaten()
+            self.grass_layer.get_eaten(sheep.pos)
             sheep.eat_grass(self.sheep_gain_from_food)
         else:
             sheep.eat_grass(1)
@@ -0,0 +1,133 @@
+"""
+Online detection of the population oscillations.
+================================
+
+Counts the local maxima of a population series over a sliding window with
+an O(1) update per step. A sample is a peak under the same definition as
+``scipy.signal.find_peaks`` with default arguments: a strict rise, an
+optional flat top, then a strict fall, all inside the window. Flat tops
+count once, at their middle.
+"""
+
+from collections import deque
+from typing import Iterable, Mapping, NamedTuple
+
+
+class Peak(NamedTuple):
+    rise: int       # index of the sample before the top
+    index: int      # index of the peak (middle of a flat top)
+    amplitude: float  # height above the lowest sample since the previous peak
+
+
+class PeakTracker:
+    """
+    Sliding-window peak counter of a single series.
+    """
+
+    def __init__(self, window: int = 100):
+        """
+        Args:
+            window (int): Number of most recent samples the peaks are searched in
+        """
+        self.window = window
+        self.t = -1
+        self.previous = None
+        self.rising = False
+        self.top_start = 0
+        self.trough = None
+        self.peaks = deque()
+        self.amplitude_sum = 0.0
+
+    def update(self, value: float) -> None:
+        """Add the next sample of the series.
+
+        Args:
+            value (float): Value of the series at the new step
+        """
+        self.t += 1
+
+        if self.previous is None:
+            self.trough = value
+        elif value > self.previous:
+            self.rising = True
+            self.top_start = self.t
+        elif value < self.previous and self.rising:
+            # The top ended at the previous sample
+            amplitude = self.previous - self.trough
+            self.peaks.append(Peak(self.top_start - 1, (self.top_start + self.t - 1) // 2, amplitude))
+            self.amplitude_sum += amplitude
+            self.rising = False
+            self.trough = value
+
+        self.trough = min(self.trough, value)
+        self.previous = value
+
+        # A peak leaves the window as soon as its rise does
+        while self.peaks and self.peaks[0].rise <= self.t - self.window:
+            self.amplitude_sum -= self.peaks.popleft().amplitude
+
+    @property
+    def num_peaks(self) -> int:
+        """Number of peaks in the window"""
+        return len(self.peaks)
+
+    @property
+    def period(self) -> float:
+        """Mean distance, in steps, between consecutive peaks of the window"""
+        if len(self.peaks) < 2:
+            return float("nan")
+        return (self.peaks[-1].index - self.peaks[0].index) / (len(self.peaks) - 1)
+
+    @property
+    def amplitude(self) -> float:
+        """Mean amplitude of the peaks of the window"""
+        if not self.peaks:
+            return 0.0
+        return self.amplitude_sum / len(self.peaks)
+
+    @property
+    def steps_since_peak(self) -> int:
+        """Number of samples since the last peak, or since the start if none"""
+        if not self.peaks:
+            return self.t + 1
+        return self.t - self.peaks[-1].index
+
+
+class OscillationTracker:
+    """
+    One PeakTracker per breed, fed with the population counts of each step.
+    """
+
+    def __init__(self, breeds: Iterable[type], window: int = 100):
+        """
+        Args:
+            breeds: Breeds to track
+            window (int): Number of most recent steps the peaks are searched in
+        """
+        self.trackers = {breed: PeakTracker(window) for breed in breeds}
+
+    def update(self, counts: Mapping[type, int]) -> None:
+        """Add the population counts of a step.
+
+        Args:
+            counts: Current count of each tracked breed
+        """
+        for breed, tracker in self.trackers.items():
+            tracker.update(counts[breed])
+
+    def num_peaks(self, breed: type) -> int:
+        return self.trackers[breed].num_peaks
+
+    def period(self, breed: type) -> float:
+        return self.trackers[breed].period
+
+    def amplitude(self, breed: type) -> float:
+        return self.trackers[breed].amplitude
+
+    def is_stagnant(self, patience: int) -> bool:
+        """Whether no population had a peak in the last ``patience`` steps
+
+        Args:
+            patience (int): Number of steps without any peak
+        """
+        return all(tracker.steps_since_peak >= patience for tracker in self.trackers.values())
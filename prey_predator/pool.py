@@ -0,0 +1,65 @@
+"""
+Free-list pool of dead agents.
+================================
+
+Births and deaths happen every step, so instead of throwing dead animals
+away and allocating new ones, the model keeps the dead ones and reuses the
+objects for the next births, with a new unique_id: the trajectory of a run
+does not depend on what the pool holds, which is neither bounded by the
+peak population nor saved in checkpoints.
+"""
+
+from collections import defaultdict
+from typing import Dict, Optional
+
+from mesa import Agent
+
+
+class AgentPool:
+    """
+    Free lists of dead agents, one per breed.
+
+    Released agents only become available after ``flush``, which the model
+    calls at the end of a step: until then the scheduler may still hold
+    them in the slots to activate this step. A free list is trimmed when
+    it grows beyond ``max_ratio`` times the live population of its breed,
+    so that the memory held after a population crash is released.
+    """
+
+    def __init__(self, max_ratio: float = 1.0, min_free: int = 64):
+        """
+        Args:
+            max_ratio (float): Largest size of a free list, relative to the
+                live population of its breed
+            min_free (int): Size a free list may always reach, whatever the
+                live population
+        """
+        self.free = defaultdict(list)
+        self.pending = []
+        self.max_ratio = max_ratio
+        self.min_free = min_free
+
+    def release(self, agent: Agent) -> None:
+        """Give back an agent removed from the grid and the schedule."""
+        self.pending.append(agent)
+
+    def flush(self, live_counts: Dict[type, int]) -> None:
+        """Make the agents released during the step available, then trim the
+        free lists grown beyond their bound.
+
+        Args:
+            live_counts: Number of live agents of each breed
+        """
+        for agent in self.pending:
+            self.free[type(agent)].append(agent)
+        self.pending.clear()
+        for breed, free in self.free.items():
+            limit = max(self.min_free, int(self.max_ratio * live_counts.get(breed, 0)))
+            if len(free) > limit:
+                # The most recently released agents are the next ones reused
+                del free[:len(free) - limit]
+
+    def acquire(self, breed: type) -> Optional[Agent]:
+        """Returns a dead agent of the breed to recycle, or None if there is none."""
+        free = self.free[breed]
+        return free.pop() if free else None
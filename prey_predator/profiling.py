@@ -0,0 +1,138 @@
+"""
+Per-phase profiling of the simulation step.
+================================
+
+A PhaseProfiler replaces methods of a model and of its scheduler, grass
+layer, data collector and numpy engine by timed wrappers set on the
+instances, and records the cumulative wall time and number of calls of
+each phase (movement, feeding, reproduction, death, grass, collect), per
+breed. Nothing is wrapped unless a profiler is attached, so a model that
+is not profiled runs exactly the same code as before, but for the moves
+of the animals: they have __slots__ and cannot hold wrappers, so they go
+through the model's event_moves hook only while ``timed_moves`` is set.
+
+Phases nest: the time of "step_breed" includes the phases of the animals
+of that breed, and "kill" is also counted in "death" or "feeding".
+"""
+
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from mesa import Model
+
+from prey_predator.agents import Sheep, Wolf
+
+
+class PhaseProfiler:
+    """
+    Cumulative and per-step timings of the phases of a model step.
+    """
+
+    def __init__(self):
+        self.total_time: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.timeline: List[Dict[str, float]] = []
+        self.step_time: Dict[str, float] = defaultdict(float)
+        self.breed = "model"
+        self.wrapped = []
+        self.model = None
+
+    def wrap(self, owner: object, name: str, phase: str, breed: Optional[Callable] = None) -> None:
+        """Replace ``owner.name`` by a timed wrapper.
+
+        Args:
+            owner (object): Instance holding the method
+            name (str): Name of the method
+            phase (str): Name of the phase the calls are counted in
+            breed (Optional[Callable]): Function of the call arguments giving
+                the breed the phase runs for. Calls without one are counted in
+                the breed of the enclosing phase.
+        """
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            enclosing_breed = self.breed
+            if breed is not None:
+                self.breed = breed(*args, **kwargs)
+            key = (phase, self.breed)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.total_time[key] += elapsed
+                self.calls[key] += 1
+                self.step_time[f"{phase}/{self.breed}"] += elapsed
+                self.breed = enclosing_breed
+
+        setattr(owner, name, timed)
+        self.wrapped.append((owner, name))
+
+    def attach(self, model: Model) -> "PhaseProfiler":
+        """Instrument the phases of a WolfSheep model.
+
+        Args:
+            model (Model): Model to profile, with either engine
+        """
+        model.timed_moves = True
+        self.wrap(model, "event_moves", "movement")
+        self.wrap(model, "event_sheep_eats_grass", "feeding")
+        self.wrap(model, "event_wolf_eats_sheep", "feeding")
+        self.wrap(model, "event_reproduces", "reproduction")
+        self.wrap(model, "verify_survivalness", "death")
+        self.wrap(model, "kill_animal", "kill")
+        self.wrap(model.schedule, "step_breed", "step_breed", breed=lambda breed: breed.__name__)
+        self.wrap(model.grass_layer, "step", "grass", breed=lambda: "Grass")
+        self.wrap(model.datacollector, "collect", "collect", breed=lambda model: "model")
+
+        if model.engine == "numpy":
+            ecosystem = model.ecosystem
+            self.wrap(ecosystem, "step_sheep", "step_breed", breed=lambda: Sheep.__name__)
+            self.wrap(ecosystem, "step_wolves", "step_breed", breed=lambda: Wolf.__name__)
+            self.wrap(ecosystem, "move", "movement")
+            self.wrap(ecosystem, "migrate", "movement")
+            self.wrap(ecosystem, "feed_sheep", "feeding")
+            self.wrap(ecosystem, "feed_wolves", "feeding")
+            self.wrap(ecosystem, "reproduction_draw", "reproduction")
+            self.wrap(ecosystem, "survival", "death")
+            self.wrap(ecosystem, "update_population", "death")
+
+        # Close the timeline entry of each step
+        step = model.step
+
+        def profiled_step(*args, **kwargs):
+            result = step(*args, **kwargs)
+            self.end_step(model.schedule.steps)
+            return result
+
+        setattr(model, "step", profiled_step)
+        self.wrapped.append((model, "step"))
+        self.model = model
+        return self
+
+    def detach(self) -> None:
+        """Remove every wrapper, the instances fall back on their class methods."""
+        for owner, name in reversed(self.wrapped):
+            delattr(owner, name)
+        self.wrapped.clear()
+        self.model.timed_moves = False
+
+    def end_step(self, step: int) -> None:
+        """Append the time spent in each phase since the last step to the timeline."""
+        self.timeline.append({"step": step, **self.step_time})
+        self.step_time = defaultdict(float)
+
+    def summary(self) -> pd.DataFrame:
+        """Cumulative time, number of calls and mean time of each phase and breed"""
+        rows = [
+            {"phase": phase, "breed": breed, "calls": self.calls[(phase, breed)],
+             "total_time": total, "mean_time": total / self.calls[(phase, breed)]}
+            for (phase, breed), total in self.total_time.items()
+        ]
+        return pd.DataFrame(rows, columns=["phase", "breed", "calls", "total_time", "mean_time"])
+
+    def timeline_dataframe(self) -> pd.DataFrame:
+        """Time spent in each phase/breed, one row per step"""
+        return pd.DataFrame(self.timeline).fillna(0.0).set_index("step")
@@ -14,10 +14,8 @@ class RandomWalker(Agent):
 
     """
 
-    grid = None
-    x = None
-    y = None
-    moore = True
+    # schedule_slot is the slot of the walker in its RandomActivationByBreed queue
+    __slots__ = ("moore", "schedule_slot")
 
     def __init__(self, unique_id, pos, model, moore=True):
         """
@@ -36,7 +34,7 @@ class RandomWalker(Agent):
         Step one cell in any allowable direction.
         """
         # Pick the next cell from the adjacent cells.
-        next_moves = self.model.grid.get_neighborhood(self.pos, self.moore, True)
-        next_move = self.random.choice(next_moves)
+        grid = self.model.grid
+        next_move = self.random.choice(grid.neighbors[self.moore][self.pos])
         # Now move:
-        self.model.grid.move_agent(self, next_move)
+        grid.move_agent_to(self, next_move)
@@ -1,7 +1,144 @@
 from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 
+import numpy as np
+from mesa import Agent
 from mesa.time import RandomActivation
 
+from prey_predator.streams import ACTIVATION, RandomStreams
+from prey_predator.vectorized import BREED_CODES
+
+
+class PopulationHistory:
+    """
+    Ring buffer of the last population counts of a fixed set of breeds.
+
+    Recording a step and reading the latest counts are O(1), so the history
+    can be queried every step without building a DataFrame. Running summary
+    statistics over every recorded step are kept as well, for runs that do
+    not collect their data.
+    """
+
+    def __init__(self, breeds: Iterable[type], size: int = 100):
+        """
+        Args:
+            breeds: Breeds to keep the history of, one column each
+            size: Number of steps kept in the buffer
+        """
+        self.columns = {breed: i for i, breed in enumerate(breeds)}
+        self.size = size
+        self.buffer = np.zeros((size, len(self.columns)), dtype=np.int64)
+        self.length = 0
+        # Welford's running mean and sum of squared deviations
+        self.mean_counts = np.zeros(len(self.columns))
+        self.squared_deviations = np.zeros(len(self.columns))
+        self.min_counts = np.full(len(self.columns), np.iinfo(np.int64).max)
+        self.max_counts = np.zeros(len(self.columns), dtype=np.int64)
+
+    def record(self, counts: Sequence[int]) -> None:
+        """
+        Append the counts of a step, overwriting the oldest one when full.
+
+        Args:
+            counts: Count of each breed, in the order given at creation
+        """
+        self.buffer[self.length % self.size] = counts
+        self.length += 1
+
+        counts = self.buffer[(self.length - 1) % self.size]
+        delta = counts - self.mean_counts
+        self.mean_counts += delta / self.length
+        self.squared_deviations += delta * (counts - self.mean_counts)
+        np.minimum(self.min_counts, counts, out=self.min_counts)
+        np.maximum(self.max_counts, counts, out=self.max_counts)
+
+    def last(self, breed: type) -> int:
+        """Returns the most recent count of a breed."""
+        return int(self.buffer[(self.length - 1) % self.size, self.columns[breed]])
+
+    def summary(self, breed: type) -> Dict[str, float]:
+        """Returns the mean, standard deviation, min and max count of a breed
+        over every recorded step."""
+        column = self.columns[breed]
+        if self.length == 0:
+            return {"mean": np.nan, "std": np.nan, "min": np.nan, "max": np.nan}
+        return {
+            "mean": float(self.mean_counts[column]),
+            "std": float(np.sqrt(self.squared_deviations[column] / self.length)),
+            "min": int(self.min_counts[column]),
+            "max": int(self.max_counts[column]),
+        }
+
+    def window(self, breed: type) -> np.ndarray:
+        """Returns the counts of a breed still in the buffer, oldest first."""
+        column = self.buffer[:, self.columns[breed]]
+        if self.length < self.size:
+            return column[:self.length]
+        head = self.length % self.size
+        return np.concatenate([column[head:], column[:head]])
+
+
+class BreedQueue:
+    """
+    Agents of one breed in dense slots, their unique ids alongside.
+
+    ``unique_ids`` is an array whose first ``len(agents)`` entries are used,
+    grown by doubling its capacity, so that it is not rebuilt at each step.
+    The agents stay in a list: numpy object arrays are not traversed by the
+    garbage collector, which could then never free a model, its agents
+    referring to it. Removing an agent only clears its slot, leaving a
+    tombstone that the activation skips, and sets its ``schedule_slot`` to
+    -1. The tombstones are dropped in a single pass once they outnumber the
+    live agents, so that a removal is O(1) and a step costs time
+    proportional to the live agents.
+    """
+
+    def __init__(self):
+        self.agents: List[Optional[Agent]] = []
+        self.unique_ids = np.empty(0, dtype=np.uint64)
+        self.tombstones = 0
+
+    def __len__(self) -> int:
+        return len(self.agents) - self.tombstones
+
+    def extend(self, agents: Sequence[Agent]) -> None:
+        """Put the agents in new slots at the end"""
+        start = len(self.agents)
+        end = start + len(agents)
+        if end > len(self.unique_ids):
+            capacity = max(end, 2 * len(self.unique_ids))
+            self.unique_ids = np.concatenate([self.unique_ids[:start], np.empty(capacity - start, dtype=np.uint64)])
+        for slot, agent in enumerate(agents, start=start):
+            agent.schedule_slot = slot
+        self.agents.extend(agents)
+        self.unique_ids[start:end] = [agent.unique_id for agent in agents]
+
+    def remove(self, agent: Agent) -> None:
+        """Leave a tombstone in the slot of the agent"""
+        self.agents[agent.schedule_slot] = None
+        agent.schedule_slot = -1
+        self.tombstones += 1
+
+    def compact(self) -> None:
+        """Drop the tombstones, the live agents keeping their order"""
+        live = self.live()
+        self.agents = []
+        self.tombstones = 0
+        self.extend(live)
+
+    def live(self) -> List[Agent]:
+        """Live agents, in the order of their slots"""
+        return [agent for agent in self.agents if agent is not None]
+
+    def activation_order(self, streams: RandomStreams, step: int, breed_code: int) -> np.ndarray:
+        """Slots in random order, tombstones included
+
+        The order is drawn from the unique ids of the agents, not from their
+        slots, so it does not depend on when the tombstones are compacted.
+        """
+        words = streams.words(ACTIVATION, step, self.unique_ids[:len(self.agents)], breed_code)
+        return np.argsort(words[0] << np.uint64(32) | words[1])
+
 
 class RandomActivationByBreed(RandomActivation):
     """
@@ -11,12 +148,34 @@ class RandomActivationByBreed(RandomActivation):
     This is equivalent to the NetLogo 'ask breed...' and is generally the
     default behavior for an ABM.
 
-    Assumes that all agents have a step() method.
+    Assumes that all agents have a step() method. The agents are kept in one
+    BreedQueue per breed, instead of the dict of the Mesa schedulers.
     """
 
-    def __init__(self, model):
+    def __init__(self, model, history_breeds: Iterable[type] = (), history_size: int = 100):
+        """
+        Args:
+            model: Model object associated with the schedule.
+            history_breeds: Breeds whose counts are kept in ``history``
+            history_size: Number of steps kept in ``history``
+        """
         super().__init__(model)
-        self.agents_by_breed = defaultdict(dict)
+        self.queues: Dict[type, BreedQueue] = defaultdict(BreedQueue)
+        self.breed_counts = defaultdict(int)
+        self.history = PopulationHistory(history_breeds, history_size)
+
+    @property
+    def agents_by_breed(self) -> Dict[type, Dict[int, Agent]]:
+        """Live agents of each breed by unique_id, built on demand"""
+        return {breed: {agent.unique_id: agent for agent in queue.live()}
+                for breed, queue in self.queues.items()}
+
+    @property
+    def agents(self) -> List[Agent]:
+        return [agent for queue in self.queues.values() for agent in queue.live()]
+
+    def get_agent_count(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
 
     def add(self, agent):
         """
@@ -25,20 +184,40 @@ class RandomActivationByBreed(RandomActivation):
         Args:
             agent: An Agent to be added to the schedule.
         """
-
-        self._agents[agent.unique_id] = agent
         agent_class = type(agent)
-        self.agents_by_breed[agent_class][agent.unique_id] = agent
+        self.queues[agent_class].extend((agent,))
+        self.breed_counts[agent_class] += 1
+
+    def add_many(self, agents):
+        """
+        Add agents of a single breed to the schedule at once.
+
+        Args:
+            agents: List of Agents of the same class, with distinct unique_ids.
+        """
+        if not agents:
+            return
+        agent_class = type(agents[0])
+        self.queues[agent_class].extend(agents)
+        self.breed_counts[agent_class] += len(agents)
 
     def remove(self, agent):
         """
         Remove all instances of a given agent from the schedule.
         """
-
-        del self._agents[agent.unique_id]
-
         agent_class = type(agent)
-        del self.agents_by_breed[agent_class][agent.unique_id]
+        self.queues[agent_class].remove(agent)
+        self.breed_counts[agent_class] -= 1
+
+    def agent_buffer(self, shuffled: bool = False) -> Iterator[Agent]:
+        """Yields the live agents of every breed, skipping the ones removed
+        while stepping"""
+        agents = self.agents
+        if shuffled:
+            self.model.random.shuffle(agents)
+        for agent in agents:
+            if agent.schedule_slot >= 0:
+                yield agent
 
     def step(self, by_breed=True):
         """
@@ -49,7 +228,7 @@ class RandomActivationByBreed(RandomActivation):
                       the next one.
         """
         if by_breed:
-            for agent_class in self.agents_by_breed:
+            for agent_class in self.queues:
                 self.step_breed(agent_class)
             self.steps += 1
             self.time += 1
@@ -60,16 +239,43 @@ class RandomActivationByBreed(RandomActivation):
         """
         Shuffle order and run all agents of a given breed.
 
+        The agents born during the step of their breed are only activated
+        from the next step on.
+
         Args:
             breed: Class object of the breed to run.
         """
-        agent_keys = list(self.agents_by_breed[breed].keys())
-        self.model.random.shuffle(agent_keys)
-        for agent_key in agent_keys:
-            self.agents_by_breed[breed][agent_key].step()
+        queue = self.queues[breed]
+        if 2 * queue.tombstones > len(queue.agents):
+            queue.compact()
+        # The breed draws from its own stream at each step, the order and
+        # number of the draws before it do not matter
+        breed_code = BREED_CODES[breed]
+        self.model.random.seed(self.model.streams.python_seed(ACTIVATION, self.steps, breed_code))
+        # The agents born meanwhile have no slot in the order, the ones
+        # removed meanwhile leave a tombstone. Indexing the list with Python
+        # ints is twice as fast as with the numpy ones.
+        agents = queue.agents
+        for slot in queue.activation_order(self.model.streams, self.steps, breed_code).tolist():
+            agent = agents[slot]
+            if agent is not None:
+                agent.step()
 
     def get_breed_count(self, breed_class):
         """
         Returns the current number of agents of certain breed in the queue.
         """
-        return len(self.agents_by_breed[breed_class].values())
+        return self.breed_counts[breed_class]
+
+    def set_breed_count(self, breed_class, count: int) -> None:
+        """
+        Overrides the count of a breed whose agents are not in the queue,
+        e.g. the animals of the numpy engine.
+        """
+        self.breed_counts[breed_class] = count
+
+    def record_history(self) -> None:
+        """
+        Appends the current counts of the tracked breeds to the history.
+        """
+        self.history.record([self.breed_counts[breed] for breed in self.history.columns])
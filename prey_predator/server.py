@@ -1,60 +1,16 @@
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule
+import os
+
+from mesa.visualization.modules import ChartModule
 from mesa.visualization.UserParam import UserSettableParameter
 
-from prey_predator.agents import Wolf, Sheep, GrassPatch
 from prey_predator.model import WolfSheep
+from prey_predator.visualization import DeltaCanvasGrid, DeltaServer
 
+# e.g. GRID_SIZE=200 STEPS_PER_FRAME=5 python run.py to watch a large run
+GRID_SIZE = int(os.getenv("GRID_SIZE", 20))
+STEPS_PER_FRAME = int(os.getenv("STEPS_PER_FRAME", 1))
 
-def wolf_sheep_portrayal(agent):
-    if agent is None:
-        return
-    
-    if agent.pos is None:
-        return
-
-    portrayal = {}
-
-    if type(agent) is Sheep:
-        # ... to be completed
-        portrayal = {
-                "Shape": "circle",
-                "Color": "blue",
-                "Filled": "true",
-                "Layer": 1,
-                "r": 0.5}
-
-    elif type(agent) is Wolf:
-        # ... to be completed
-        portrayal = {"Shape": "circle",
-                "Color": "red",
-                "Filled": "true",
-                "Layer": 1,
-                "r": 0.7}
-
-    elif type(agent) is GrassPatch:
-        # ... to be completed
-        if agent.fully_grown:
-            portrayal = {"Shape": "rect",
-                    "Color": "green",
-                    "Filled": "true",
-                    "Layer": 0,
-                    "w": 1,
-                    "h": 1 }
-        else:
-            portrayal = {"Shape": "rect",
-                    "Color": "gray",
-                    "Filled": "false",
-                    "Layer": 0,
-                    "w": 1,
-                    "h": 1 }
-
-    return portrayal
-
-
-GRID_SIZE = 20
-
-canvas_element = CanvasGrid(wolf_sheep_portrayal, GRID_SIZE, GRID_SIZE , 600, 600)
+canvas_element = DeltaCanvasGrid(GRID_SIZE, GRID_SIZE, 600, 600)
 chart_element = ChartModule(
     [{"Label": "Wolves", "Color": "#AA0000"}, {"Label": "Sheep", "Color": "#666666"}]
 )
@@ -74,10 +30,12 @@ model_params = {
     "sheep_gain_from_food": UserSettableParameter("slider", "Sheep gain from food", 4, 0, 100, 1),
     "grass_regrowth_time": UserSettableParameter("slider", "Grass regrowth time", 7, 0, 100, 1),
     "death_age_wolf":  UserSettableParameter("slider", "Death age wolf", 29, 0, 100, 1), 
-    "death_age_sheep":  UserSettableParameter("slider", "Death age sheep", 19, 0, 100, 1)
+    "death_age_sheep":  UserSettableParameter("slider", "Death age sheep", 19, 0, 100, 1),
+    "engine": UserSettableParameter("choice", "Engine", value="agents", choices=["agents", "numpy"]),
 }
 
-server = ModularServer(
+server = DeltaServer(
     WolfSheep, [canvas_element, chart_element], "Prey Predator Model", model_params
 )
 server.port = 8521
+server.steps_per_frame = STEPS_PER_FRAME
@@ -0,0 +1,288 @@
+"""
+Sharded simulation of one large grid.
+================================
+
+Splits the torus of a numpy-engine model into strips along its first axis,
+each owned and stepped by its own worker process. Once the animals have
+moved every rule is local to a cell, so the only halo exchanged between
+neighbouring strips is the animals that walked across an edge: after each
+breed moves, every worker writes its leavers into shared-memory boundary
+buffers, waits on a barrier and appends the animals its neighbours sent.
+
+The population counts of every strip are written to a shared array at each
+step and summed by the coordinator. The animals draw their random numbers
+from counter-based streams by id (see prey_predator.streams), and keep their
+id when changing strip, so a sharded run follows the same trajectory as a
+single-process numpy-engine run with the same seed, whatever the number of
+strips.
+"""
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from prey_predator.model import WolfSheep
+from prey_predator.streams import MASK_32
+from prey_predator.vectorized import SHEEP, WOLF, VectorizedEcosystem, draw_lots, initial_positions
+
+LEFT = 0
+RIGHT = 1
+
+# Fields of an animal in the boundary buffers, its column is implied by the edge.
+# The 64-bit id is split in two halves, exact in the float buffers.
+HALO_FIELDS = ("y", "energy", "age", "id_low", "id_high")
+
+# Type of the shared arrays
+DTYPES = {"halo": np.float64, "halo_count": np.int64, "counts": np.int64}
+
+
+class TileEcosystem(VectorizedEcosystem):
+    """
+    Numpy engine of one strip of a sharded grid.
+
+    ``x`` is local to the strip and ``y`` spans the whole torus. Animals
+    stepping out of the strip are handed over to the neighbouring strip
+    through ``halo``, with one buffer per breed so that a breed's buffer
+    is only rewritten once every worker went through the other breed's
+    barrier, i.e. is done reading it.
+    """
+
+    def __init__(
+        self,
+        model: WolfSheep,
+        initial_sheep: int,
+        initial_wolves: int,
+        tile: int,
+        first_column: int,
+        grid_width: int,
+        halo: np.ndarray,
+        halo_count: np.ndarray,
+        barrier,
+        **kwargs,
+    ):
+        """
+        Args:
+            model: Model of the strip, the grid being the strip itself
+            initial_sheep: Number of sheep to start with in the whole grid
+            initial_wolves: Number of wolves to start with in the whole grid
+            tile: Index of the strip
+            first_column: Column of the whole grid where the strip starts
+            grid_width: Number of columns of the whole grid
+            halo: Shared boundary buffers, of shape
+                (breeds, tiles, sides, capacity, len(HALO_FIELDS))
+            halo_count: Shared number of animals in each buffer, of shape
+                (breeds, tiles, sides)
+            barrier: Barrier shared by the workers of all the strips
+            **kwargs: See VectorizedEcosystem
+        """
+        self.first_column = first_column
+        self.grid_width = grid_width
+        super().__init__(model, initial_sheep, initial_wolves, **kwargs)
+        tiles = halo.shape[1]
+        self.tile = tile
+        self.left = (tile - 1) % tiles
+        self.right = (tile + 1) % tiles
+        self.halo = halo
+        self.halo_count = halo_count
+        self.barrier = barrier
+
+    def create_animals(self, initial_sheep: int, initial_wolves: int) -> None:
+        """Create the initial animals of the whole grid standing in the strip."""
+        ids = np.arange(initial_sheep + initial_wolves, dtype=np.uint64)
+        x, y = initial_positions(self.streams, ids, self.grid_width, self.height)
+        inside = (x >= self.first_column) & (x < self.first_column + self.width)
+        self.id = ids[inside]
+        self.breed = np.repeat(np.array([SHEEP, WOLF], dtype=np.int8), [initial_sheep, initial_wolves])[inside]
+        self.x = x[inside] - self.first_column
+        self.y = y[inside]
+        self.energy = np.ones(self.id.size, dtype=float)
+        self.age = np.zeros(self.id.size, dtype=np.int64)
+
+    def move(self, idx: np.ndarray) -> None:
+        """Step each of the given animals to a random cell of its neighborhood.
+
+        The strip does not wrap along x, animals stepping out of it are
+        handed over by migrate.
+        """
+        choice = self.choice[idx]
+        self.x[idx] = self.x[idx] + self.offsets[choice, 0]
+        self.y[idx] = (self.y[idx] + self.offsets[choice, 1]) % self.height
+
+    def migrate(self, idx: np.ndarray, breed: int) -> np.ndarray:
+        """Send the animals that left the strip and receive the ones entering it.
+
+        Args:
+            idx (np.ndarray): Indices of the animals of the breed that moved
+            breed (int): Breed code of the animals
+
+        Returns:
+            np.ndarray: Indices of the animals of the breed now in the strip
+        """
+        capacity = self.halo.shape[3]
+        x = self.x[idx]
+        leavers = {LEFT: idx[x < 0], RIGHT: idx[x >= self.width]}
+        for side, leaving in leavers.items():
+            if leaving.size > capacity:
+                raise RuntimeError(f"{leaving.size} animals leaving strip {self.tile}, "
+                                   f"above the halo capacity of {capacity}")
+            buffer = self.halo[breed, self.tile, side]
+            buffer[:leaving.size, 0] = self.y[leaving]
+            buffer[:leaving.size, 1] = self.energy[leaving]
+            buffer[:leaving.size, 2] = self.age[leaving]
+            buffer[:leaving.size, 3] = self.id[leaving] & MASK_32
+            buffer[:leaving.size, 4] = self.id[leaving] >> np.uint64(32)
+            self.halo_count[breed, self.tile, side] = leaving.size
+
+        self.barrier.wait()
+
+        # What leaves the left neighbour by its right edge enters by our left edge
+        arrivals = [
+            (self.halo[breed, source, side, :self.halo_count[breed, source, side]], column)
+            for source, side, column in ((self.left, RIGHT, 0), (self.right, LEFT, self.width - 1))
+        ]
+        entering = np.concatenate([animals for animals, _ in arrivals])
+        columns = np.concatenate([np.full(len(animals), column) for animals, column in arrivals])
+
+        keep = np.ones(self.breed.size, dtype=bool)
+        keep[leavers[LEFT]] = False
+        keep[leavers[RIGHT]] = False
+        self.x = np.concatenate([self.x[keep], columns])
+        self.y = np.concatenate([self.y[keep], entering[:, 0].astype(np.int64)])
+        self.energy = np.concatenate([self.energy[keep], entering[:, 1]])
+        self.age = np.concatenate([self.age[keep], entering[:, 2].astype(np.int64)])
+        self.breed = np.concatenate([self.breed[keep], np.full(len(entering), breed, dtype=np.int8)])
+        entering_id = entering[:, 3].astype(np.uint64) | entering[:, 4].astype(np.uint64) << np.uint64(32)
+        self.id = np.concatenate([self.id[keep], entering_id])
+        # The draws of an animal only depend on its id, the arrivals draw theirs again
+        lots = draw_lots(self.streams, self.steps, entering_id, breed, len(self.offsets))
+        for name, values in zip(("choice", "rank", "birth"), lots):
+            setattr(self, name, np.concatenate([getattr(self, name)[keep], values]))
+        return np.flatnonzero(self.breed == breed)
+
+
+def step_tile(
+    tile: int,
+    params: Dict[str, Any],
+    strip: int,
+    first_column: int,
+    initial_sheep: int,
+    initial_wolves: int,
+    step_count: int,
+    seed: int,
+    arrays: Dict[str, np.ndarray],
+    barrier,
+) -> None:
+    """Build the model of one strip and step it, writing its counts at each step"""
+    # The animals of the strip are picked among the ones of the whole grid by its own engine below
+    model = WolfSheep(**dict(params, height=strip, density_sheep=0, density_wolves=0,
+                             engine="numpy", seed=seed))
+    model.initial_sheep = initial_sheep
+    model.initial_wolves = initial_wolves
+    model.ecosystem = TileEcosystem(model, initial_sheep, initial_wolves,
+                                    tile=tile, first_column=first_column,
+                                    grid_width=params.get("height", 20), halo=arrays["halo"], halo_count=arrays["halo_count"],
+                                    barrier=barrier,
+                                    death_age_sheep=params.get("death_age_sheep", 15),
+                                    death_age_wolf=params.get("death_age_wolf", 15),
+                                    sheep_energy_decay=params.get("sheep_energy_decay", 1),
+                                    wolf_energy_decay=params.get("wolf_energy_decay", 1))
+
+    counts = arrays["counts"]
+    for step in range(step_count):
+        counts[step, tile] = np.bincount(model.ecosystem.breed, minlength=2)
+        model.step()
+    counts[step_count, tile] = np.bincount(model.ecosystem.breed, minlength=2)
+
+
+def run_tile(tile: int, shm_names: Dict[str, str], shapes: Dict[str, tuple], barrier, *args) -> None:
+    """Worker process of one strip, see step_tile for the other arguments"""
+    blocks = {name: shared_memory.SharedMemory(name=shm_name) for name, shm_name in shm_names.items()}
+    try:
+        arrays = {name: np.ndarray(shape, dtype=DTYPES[name], buffer=blocks[name].buf)
+                  for name, shape in shapes.items()}
+        step_tile(tile, *args, arrays, barrier)
+    except BaseException:
+        # Release the other workers instead of leaving them waiting for this one
+        barrier.abort()
+        raise
+    arrays = None
+    for block in blocks.values():
+        block.close()
+
+
+def run_sharded(
+    params: Dict[str, Any],
+    step_count: int,
+    tiles: Optional[int] = None,
+    seed: Optional[int] = None,
+    halo_capacity: Optional[int] = None,
+) -> pd.DataFrame:
+    """Run one model whose grid is split between several worker processes
+
+    Args:
+        params (Dict[str, Any]): Ecological parameters of WolfSheep, the engine
+            is always numpy
+        step_count (int): Number of steps to run
+        tiles (Optional[int]): Number of strips and worker processes, the number
+            of cores by default
+        seed (Optional[int]): Seed of the run, shared by every strip
+        halo_capacity (Optional[int]): Most animals that can leave a strip by
+            one edge in one step, 16 per cell of the edge by default
+
+    Returns:
+        pd.DataFrame: Number of "Wolves" and "Sheep" over the whole grid, one
+            row per step like the model's data collector, plus the final state
+    """
+    params = dict(params)
+    params.pop("engine", None)
+    height = params.get("height", 20)
+    width = params.get("width", 20)
+    tiles = min(tiles or os.cpu_count(), height)
+    if halo_capacity is None:
+        halo_capacity = 16 * width
+
+    strips = [len(rows) for rows in np.array_split(np.arange(height), tiles)]
+    first_columns = np.cumsum([0] + strips[:-1]).tolist()
+    initial_sheep = int(width * height * params.get("density_sheep", 0.5))
+    initial_wolves = int(width * height * params.get("density_wolves", 0.5))
+    if seed is None:
+        # Every strip must draw from the same streams
+        seed = np.random.SeedSequence().entropy
+
+    shapes = {
+        "halo": (2, tiles, 2, halo_capacity, len(HALO_FIELDS)),
+        "halo_count": (2, tiles, 2),
+        "counts": (step_count + 1, tiles, 2),
+    }
+    blocks = {
+        name: shared_memory.SharedMemory(create=True, size=np.dtype(DTYPES[name]).itemsize * int(np.prod(shape)))
+        for name, shape in shapes.items()
+    }
+    try:
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(tiles)
+        shm_names = {name: block.name for name, block in blocks.items()}
+        workers = [
+            context.Process(target=run_tile,
+                            args=(tile, shm_names, shapes, barrier, params, strips[tile], first_columns[tile],
+                                  initial_sheep, initial_wolves, step_count, seed))
+            for tile in range(tiles)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if any(worker.exitcode != 0 for worker in workers):
+            raise RuntimeError("A worker of the sharded run failed")
+
+        # Reduce the counts of the strips
+        counts = np.ndarray(shapes["counts"], dtype=DTYPES["counts"], buffer=blocks["counts"].buf).sum(axis=1)
+        return pd.DataFrame({"Wolves": counts[:, WOLF], "Sheep": counts[:, SHEEP]})
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
@@ -0,0 +1,123 @@
+"""
+Grid with a per-breed occupancy index.
+================================
+
+Mesa's MultiGrid keeps a plain list per cell, so placing and removing an
+agent scans the cell, and finding an animal of a given breed means
+scanning every cellmate. This grid stores each cell as an insertion-ordered
+dict and also indexes the agents of each cell by breed.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from mesa import Agent
+from mesa.space import MultiGrid
+
+Coordinate = Tuple[int, int]
+
+
+class NeighborTable(dict):
+    """
+    Neighborhood of each cell of a torus, center included, keyed by position.
+
+    Entries are filled on first access and hold the same cells, in the same
+    sorted order, as ``get_neighborhood(pos, moore, True)``, so that picking
+    one at random gives the same result for the same random state.
+    """
+
+    def __init__(self, width: int, height: int, moore: bool) -> None:
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.offsets = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                        if moore or abs(dx) + abs(dy) <= 1]
+
+    def __missing__(self, pos: Coordinate) -> Tuple[Coordinate, ...]:
+        x, y = pos
+        neighbors = tuple(sorted({((x + dx) % self.width, (y + dy) % self.height)
+                                  for dx, dy in self.offsets}))
+        self[pos] = neighbors
+        return neighbors
+
+
+class BreedIndexedGrid(MultiGrid):
+    """
+    MultiGrid kept up to date with a per-cell, per-breed index of the agents.
+
+    ``by_breed[breed][pos]`` holds the agents of that breed in the cell, and
+    only exists while the cell has some.
+    """
+
+    def __init__(self, width: int, height: int, torus: bool) -> None:
+        super().__init__(width, height, torus)
+        self.by_breed: Dict[type, Dict[Coordinate, Dict[Agent, None]]] = defaultdict(dict)
+        self.neighbors = {moore: NeighborTable(self.width, self.height, moore) for moore in (False, True)}
+
+    @staticmethod
+    def default_val() -> Dict[Agent, None]:
+        """Default value for new cell elements, used as an ordered set."""
+        return {}
+
+    def _place_agent(self, pos: Coordinate, agent: Agent) -> None:
+        x, y = pos
+        self.grid[x][y][agent] = None
+        self.empties.discard(pos)
+
+        cells = self.by_breed[type(agent)]
+        if pos not in cells:
+            cells[pos] = {}
+        cells[pos][agent] = None
+
+    def _remove_agent(self, pos: Coordinate, agent: Agent) -> None:
+        x, y = pos
+        del self.grid[x][y][agent]
+        if not self.grid[x][y]:
+            self.empties.add(pos)
+
+        cells = self.by_breed[type(agent)]
+        del cells[pos][agent]
+        if not cells[pos]:
+            del cells[pos]
+
+    def place_agents(self, agents: List[Agent], positions: List[Coordinate]) -> None:
+        """Position many agents on the grid at once and set their pos variable.
+
+        Args:
+            agents: Agents to place, none of them already on the grid
+            positions: Position of each agent
+        """
+        grid = self.grid
+        by_breed = self.by_breed
+        for agent, pos in zip(agents, positions):
+            x, y = pos
+            grid[x][y][agent] = None
+            cells = by_breed[type(agent)]
+            if pos in cells:
+                cells[pos][agent] = None
+            else:
+                cells[pos] = {agent: None}
+            agent.pos = pos
+        self.empties.difference_update(positions)
+
+    def move_agent_to(self, agent: Agent, pos: Coordinate) -> None:
+        """Move an agent and set its pos variable.
+
+        Unlike move_agent, the position is not wrapped around the torus, it
+        must already be a cell of the grid, e.g. from ``neighbors``.
+
+        Args:
+            agent: Agent to move, already on the grid
+            pos: New position of the agent
+        """
+        self._remove_agent(agent.pos, agent)
+        self._place_agent(pos, agent)
+        agent.pos = pos
+
+    def get_breed_contents(self, pos: Coordinate, breed: type) -> List[Agent]:
+        """Returns the agents of the breed in the cell.
+
+        The list is a copy, the agents can be moved or removed while iterating.
+        """
+        cell = self.by_breed[breed].get(pos)
+        return list(cell) if cell else []
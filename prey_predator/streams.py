@@ -0,0 +1,123 @@
+"""
+Counter-based random streams.
+================================
+
+A single sequential generator makes a run depend on the order its numbers
+are consumed in: stepping the animals in another order, in batches or in
+several processes changes every draw that follows. Here every random number
+is instead a pure function of the run's key and of a counter naming what it
+is drawn for: the purpose (initial position, what an animal does in a step,
+activation order of the agents), the step, the breed and the id of the
+animal. It is the Philox4x32-10 block cipher of Random123 (the 32-bit
+sibling of ``numpy.random.Philox``) applied to that counter, evaluated on
+whole arrays of ids at once.
+
+An animal therefore draws the same numbers whichever process holds it and
+wherever it is stored, so batched and sharded runs reproduce the trajectory
+of a single-process run with the same seed.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Purposes of the draws, one independent stream each
+INIT = 0
+# Move, rank in the cell and reproduction of an animal at a step
+LOTS = 1
+ACTIVATION = 2
+
+PHILOX_M = np.array([[0xD2511F53], [0xCD9E8D57]], dtype=np.uint64)
+PHILOX_W = np.array([[0x9E3779B9], [0xBB67AE85]], dtype=np.uint64)
+PHILOX_ROUNDS = 10
+PHILOX_BLOCK = 8192
+MASK_32 = np.uint64(0xFFFFFFFF)
+UNIT_32 = 2.0 ** -32
+
+
+def round_keys(key: Tuple) -> np.ndarray:
+    """(rounds, 2, ...) keys of each round of Philox4x32-10, from its two
+    32-bit key words, ints or arrays of one key per counter"""
+    key = np.array([np.asarray(word, dtype=np.uint64).reshape(-1) for word in key])
+    return (key[None] + np.arange(PHILOX_ROUNDS, dtype=np.uint64)[:, None, None] * PHILOX_W[None]) & MASK_32
+
+
+def philox4x32(counter: List[np.ndarray], keys: np.ndarray) -> List[np.ndarray]:
+    """Philox4x32-10 of every counter
+
+    Args:
+        counter (List[np.ndarray]): Four arrays of 32-bit words, as uint64
+        keys (np.ndarray): Keys of the rounds, see round_keys
+
+    Returns:
+        List[np.ndarray]: Four arrays of random 32-bit words, as uint64
+    """
+    shape = np.broadcast_shapes(*(np.shape(word) for word in counter))
+    # Words 0 and 2 go through the multiplications, 1 and 3 are xored, both
+    # pairs are processed at once
+    multiplied = np.empty((2,) + shape, dtype=np.uint64)
+    xored = np.empty((2,) + shape, dtype=np.uint64)
+    multiplied[0], xored[0], multiplied[1], xored[1] = counter
+    multiplied = multiplied.reshape(2, -1)
+    xored = xored.reshape(2, -1)
+    keys = keys.reshape(PHILOX_ROUNDS, 2, -1)
+
+    # Blocks small enough for the intermediate arrays to stay in cache
+    for start in range(0, multiplied.shape[1], PHILOX_BLOCK):
+        block = slice(start, start + PHILOX_BLOCK)
+        m, x = multiplied[:, block], xored[:, block]
+        for key in (keys if keys.shape[2] == 1 else keys[:, :, block]):
+            product = PHILOX_M * m
+            m = (product >> np.uint64(32))[::-1] ^ x
+            m ^= key
+            x = (product & MASK_32)[::-1]
+        multiplied[:, block] = m
+        xored[:, block] = x
+    return [multiplied[0].reshape(shape), xored[0].reshape(shape),
+            multiplied[1].reshape(shape), xored[1].reshape(shape)]
+
+
+def to_unit(high: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """Uniform floats in [0, 1) with 53 random bits taken from two 32-bit words"""
+    return ((high >> np.uint64(5)) * 67108864.0 + (low >> np.uint64(6))) / 9007199254740992.0
+
+
+class RandomStreams:
+    """
+    Random numbers of a run, addressed by (purpose, step, breed, id).
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        """
+        Args:
+            seed (Optional[int]): Seed of the run, fresh entropy if None
+        """
+        self.key = tuple(int(word) for word in np.random.SeedSequence(seed).generate_state(2))
+        self.keys = round_keys(self.key)
+
+    @classmethod
+    def from_key(cls, key: Tuple) -> "RandomStreams":
+        """Streams of a given key, e.g. arrays holding the key of each animal
+        of a batch of runs"""
+        streams = cls.__new__(cls)
+        streams.key = key
+        streams.keys = round_keys(key)
+        return streams
+
+    def words(self, purpose: int, step: int, ids: np.ndarray, breeds) -> List[np.ndarray]:
+        """Four random 32-bit words per animal
+
+        Args:
+            purpose (int): What the numbers are drawn for, e.g. LOTS
+            step (int): Step of the model
+            ids (np.ndarray): 64-bit ids of the animals
+            breeds: Breed code of each animal, or of all of them
+        """
+        ids = np.asarray(ids, dtype=np.uint64)
+        counter = [ids & MASK_32, ids >> np.uint64(32), step, np.uint64(purpose << 8) | np.asarray(breeds, dtype=np.uint64)]
+        return philox4x32(counter, self.keys)
+
+    def python_seed(self, purpose: int, step: int, breed: int) -> int:
+        """128-bit seed of a ``random.Random`` stream of one breed and step"""
+        words = self.words(purpose, step, np.zeros(1, dtype=np.uint64), breed)
+        return sum(int(word[0]) << (32 * i) for i, word in enumerate(words))
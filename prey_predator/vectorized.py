@@ -0,0 +1,367 @@
+"""
+Vectorized engine for the Wolf-Sheep model.
+================================
+
+Keeps every animal in struct-of-arrays NumPy buffers (position, energy, age
+and breed) and runs each phase of the step as batched array operations
+instead of calling one Python ``step()`` per agent.
+
+The ecological rules are the ones of the agent engine: each breed moves,
+eats, reproduces and is culled in that order, sheep before wolves, grass
+last (see prey_predator.grass). Within a cell only the first animal of the (random) activation order
+gets the food, which is reproduced here by electing one random winner per
+cell.
+
+Every animal carries a 64-bit id, and its random numbers are drawn from the
+model's counter-based streams (see prey_predator.streams) by id, step and
+purpose, so that a step does not depend on the order the animals are stored
+in.
+"""
+
+from typing import Tuple
+
+import numpy as np
+from mesa import Model
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.streams import INIT, LOTS, UNIT_32, RandomStreams, to_unit
+
+
+SHEEP = 0
+WOLF = 1
+
+BREED_CODES = {Sheep: SHEEP, Wolf: WOLF}
+
+# (dx, dy) offsets of the neighborhood, center included
+MOORE_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+VON_NEUMANN_OFFSETS = np.array([(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)])
+
+SPLITMIX_GAMMA = 0x9E3779B97F4A7C15
+
+
+def initial_positions(streams: RandomStreams, ids: np.ndarray, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Uniformly random initial (x, y) of the animals of the given ids
+
+    Args:
+        streams (RandomStreams): Random streams of the model
+        ids (np.ndarray): Ids of the animals
+        width, height: Size of the grid
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: x and y of each animal
+    """
+    words = streams.words(INIT, 0, ids, 0)
+    x = (to_unit(words[0], words[1]) * width).astype(np.int64)
+    y = (to_unit(words[2], words[3]) * height).astype(np.int64)
+    return x, y
+
+
+def draw_lots(streams: RandomStreams, step: int, ids: np.ndarray, breeds: np.ndarray, sizes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Random numbers of the animals for the phase of their breed in a step
+
+    Args:
+        streams (RandomStreams): Random streams of the model
+        step (int): Step being run
+        ids (np.ndarray): Ids of the animals
+        breeds (np.ndarray): Breed code of each animal
+        sizes: Number of cells of the neighborhood of each animal, or of all
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Index of the move of each
+            animal in its neighborhood, its rank in its cell (the lowest eats)
+            and the uniform number compared to its reproduction probability
+    """
+    words = streams.words(LOTS, step, ids, breeds)
+    choice = ((words[0] * np.asarray(sizes, dtype=np.uint64)) >> np.uint64(32)).astype(np.int64)
+    return choice, words[1], words[2] * UNIT_32
+
+
+def child_ids(parents: np.ndarray, step: int) -> np.ndarray:
+    """Ids of the children born at a step from the parents of the given ids
+
+    The (parent, step) pair goes through the SplitMix64 finalizer, a
+    bijection, so that distinct pairs give distinct ids with overwhelming
+    probability.
+    """
+    z = parents + np.uint64((step + 1) * SPLITMIX_GAMMA % 2 ** 64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class VectorizedEcosystem:
+    """
+    Struct-of-arrays state of all the animals of a WolfSheep model.
+
+    Animals are stored densely: index ``i`` of ``x``, ``y``, ``energy``,
+    ``age``, ``breed`` and ``id`` describes the same animal. Dead animals
+    are dropped and newborns appended at the end of each breed phase.
+
+    The rules read the parameters of an animal through for_animals, so that
+    subclasses holding several models (see prey_predator.ensemble) can keep
+    one value per model.
+    """
+
+    # Fields a newborn copies from its parent
+    inherited = ("x", "y", "breed")
+
+    def __init__(
+        self,
+        model: Model,
+        initial_sheep: int,
+        initial_wolves: int,
+        death_age_sheep: int = 15,
+        death_age_wolf: int = 15,
+        sheep_energy_decay: float = 1,
+        wolf_energy_decay: float = 1,
+    ):
+        """
+        Create the animals of the model at uniformly random positions.
+
+        Args:
+            model: WolfSheep model holding the ecological parameters
+            initial_sheep: Number of sheep to start with
+            initial_wolves: Number of wolves to start with
+            death_age_sheep: Age at which sheep die, if aging is enabled
+            death_age_wolf: Age at which wolves die, if aging is enabled
+            sheep_energy_decay: Energy lost by a sheep at each step
+            wolf_energy_decay: Energy lost by a wolf at each step
+        """
+        self.model = model
+        self.width = model.grid.width
+        self.height = model.grid.height
+
+        self.cell_count = self.width * self.height
+
+        self.offsets = MOORE_OFFSETS if model.moore else VON_NEUMANN_OFFSETS
+        self.neighborhood_size = len(self.offsets)
+        self.death_age = np.array([death_age_sheep, death_age_wolf])
+        self.energy_decay = np.array([sheep_energy_decay, wolf_energy_decay], dtype=float)
+        self.reproduce = np.array([model.sheep_reproduce, model.wolf_reproduce])
+        self.aging_effect = model.aging_effect
+        self.grass = model.grass
+        self.sheep_gain_from_food = model.sheep_gain_from_food
+        self.wolf_gain_from_food = model.wolf_gain_from_food
+        self.regrowth_time = model.grass_layer.regrowth_time
+        # Regrowth countdown of the grass of each cell, a view indexed by cell_of
+        self.countdown = model.grass_layer.countdown.reshape(-1)
+
+        self.create_animals(initial_sheep, initial_wolves)
+        self.update_counts()
+
+    def create_animals(self, initial_sheep: int, initial_wolves: int) -> None:
+        """Create the initial animals, with ids 0 to n - 1, sheep first."""
+        self.id = np.arange(initial_sheep + initial_wolves, dtype=np.uint64)
+        self.breed = np.repeat(np.array([SHEEP, WOLF], dtype=np.int8), [initial_sheep, initial_wolves])
+        self.x, self.y = initial_positions(self.streams, self.id, self.width, self.height)
+        self.energy = np.ones(self.id.size, dtype=float)
+        self.age = np.zeros(self.id.size, dtype=np.int64)
+
+    @property
+    def streams(self) -> RandomStreams:
+        return self.model.streams
+
+    @property
+    def steps(self) -> int:
+        """Step being run, the random numbers of the animals depend on it"""
+        return self.model.schedule.steps
+
+    def streams_of(self, idx: np.ndarray) -> RandomStreams:
+        """Random streams the given animals draw from"""
+        return self.streams
+
+    def for_animals(self, values, idx: np.ndarray) -> np.ndarray:
+        """Value of a parameter for each of the given animals
+
+        Args:
+            values: Value of the parameter, e.g. ``self.reproduce[breed]``
+            idx (np.ndarray): Indices of the animals
+
+        Returns:
+            np.ndarray: Array shaped like idx
+        """
+        return np.broadcast_to(values, idx.shape)
+
+    def draw(self, idx: np.ndarray) -> None:
+        """Draw the move, rank and reproduction number of the given animals,
+        see draw_lots.
+
+        Args:
+            idx (np.ndarray): Indices of the animals of the breed being stepped
+        """
+        n = self.id.size
+        self.choice = np.zeros(n, dtype=np.int64)
+        self.rank = np.zeros(n, dtype=np.uint64)
+        self.birth = np.ones(n)
+        sizes = self.for_animals(self.neighborhood_size, idx)
+        self.choice[idx], self.rank[idx], self.birth[idx] = draw_lots(self.streams_of(idx), self.steps,
+                                                                      self.id[idx], self.breed[idx], sizes)
+
+    def update_counts(self) -> None:
+        """Report the number of animals of each breed to the model's scheduler."""
+        counts = np.bincount(self.breed, minlength=len(BREED_CODES))
+        for breed, code in BREED_CODES.items():
+            self.model.schedule.set_breed_count(breed, int(counts[code]))
+
+    def step(self) -> None:
+        """Advance all the animals by one step, the grass is left to the model."""
+        self.step_sheep()
+        self.step_wolves()
+        self.update_counts()
+
+    def step_sheep(self) -> None:
+        """Move, feed, reproduce and cull every sheep."""
+        idx = np.flatnonzero(self.breed == SHEEP)
+        self.draw(idx)
+        self.move(idx)
+        idx = self.migrate(idx, SHEEP)
+        self.feed_sheep(idx)
+        parents, child_energy = self.reproduction_draw(idx, SHEEP)
+        dead = self.survival(idx, SHEEP)
+        self.update_population(dead, parents, child_energy)
+
+    def step_wolves(self) -> None:
+        """Move, reproduce, feed and cull every wolf."""
+        idx = np.flatnonzero(self.breed == WOLF)
+        self.draw(idx)
+        self.move(idx)
+        idx = self.migrate(idx, WOLF)
+        parents, child_energy = self.reproduction_draw(idx, WOLF)
+        eaten = self.feed_wolves(idx)
+        dead = np.concatenate([self.survival(idx, WOLF), eaten])
+        self.update_population(dead, parents, child_energy)
+
+    def feed_sheep(self, idx: np.ndarray) -> None:
+        """Let the first sheep of each cell with grown grass eat it, or every
+        sheep gain 1 without grass.
+
+        Args:
+            idx (np.ndarray): Indices of the sheep
+        """
+        grass = self.for_animals(self.grass, idx)
+        self.energy[idx[~grass]] += 1
+
+        idx = idx[grass]
+        countdown = self.countdown
+        grown = countdown[self.cell_of(idx)] == 0
+        winners = self.elect_one_per_cell(idx[grown])
+        self.energy[winners] += self.for_animals(self.sheep_gain_from_food, winners)
+        countdown[self.cell_of(winners)] = self.for_animals(self.regrowth_time, winners)
+
+    def feed_wolves(self, idx: np.ndarray) -> np.ndarray:
+        """Let the first wolf of each cell with sheep eat all of them.
+
+        Args:
+            idx (np.ndarray): Indices of the wolves
+
+        Returns:
+            np.ndarray: Indices of the eaten sheep
+        """
+        sheep = np.flatnonzero(self.breed == SHEEP)
+        sheep_cells = self.cell_of(sheep)
+        preys = np.bincount(sheep_cells, minlength=self.cell_count)
+        hunting = preys[self.cell_of(idx)] > 0
+        winners = self.elect_one_per_cell(idx[hunting])
+        winner_cells = self.cell_of(winners)
+        self.energy[winners] += self.for_animals(self.wolf_gain_from_food, winners) * preys[winner_cells]
+        hunted = np.zeros(self.cell_count, dtype=bool)
+        hunted[winner_cells] = True
+        return sheep[hunted[sheep_cells]]
+
+    def cell_of(self, idx: np.ndarray) -> np.ndarray:
+        """Flat cell index of the given animals, below cell_count."""
+        return self.x[idx] * self.height + self.y[idx]
+
+    def move(self, idx: np.ndarray) -> None:
+        """Step each of the given animals to a random cell of its neighborhood.
+
+        Args:
+            idx (np.ndarray): Indices of the animals to move
+        """
+        choice = self.choice[idx]
+        self.x[idx] = (self.x[idx] + self.offsets[choice, 0]) % self.width
+        self.y[idx] = (self.y[idx] + self.offsets[choice, 1]) % self.height
+
+    def migrate(self, idx: np.ndarray, breed: int) -> np.ndarray:
+        """Hand over the animals that moved out of the grid held by this engine.
+
+        The whole torus is held here, so nothing leaves it, see
+        prey_predator.sharded for grids split across processes.
+
+        Args:
+            idx (np.ndarray): Indices of the animals of the breed that moved
+            breed (int): Breed code of the animals
+
+        Returns:
+            np.ndarray: Indices of the animals of the breed now in the grid
+        """
+        return idx
+
+    def elect_one_per_cell(self, idx: np.ndarray) -> np.ndarray:
+        """Pick one random animal in each cell occupied by the given animals.
+
+        The animal of lowest random rank wins, whatever the order of idx,
+        ties being broken by id.
+
+        Args:
+            idx (np.ndarray): Indices of the candidate animals
+
+        Returns:
+            np.ndarray: Indices of the elected animals, one per cell
+        """
+        cells = self.cell_of(idx)
+        order = np.lexsort((self.id[idx], self.rank[idx], cells))
+        cells = cells[order]
+        first = np.ones(cells.size, dtype=bool)
+        first[1:] = cells[1:] != cells[:-1]
+        return idx[order[first]]
+
+    def reproduction_draw(self, idx: np.ndarray, breed: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the animals giving birth this step.
+
+        Args:
+            idx (np.ndarray): Indices of the animals of the breed
+            breed (int): Breed code of the animals
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Indices of the parents and energy of
+                each child, half of the parent's current energy
+        """
+        parents = idx[self.birth[idx] <= self.for_animals(self.reproduce[breed], idx)]
+        return parents, self.energy[parents] // 2
+
+    def survival(self, idx: np.ndarray, breed: int) -> np.ndarray:
+        """Age the given animals and spend their energy.
+
+        Args:
+            idx (np.ndarray): Indices of the animals of the breed
+            breed (int): Breed code of the animals
+
+        Returns:
+            np.ndarray: Indices of the animals that died
+        """
+        dead = self.energy[idx] == 0
+        aging = ~dead & self.for_animals(self.aging_effect, idx)
+        self.age[idx[aging]] += 1
+        dead[aging] = self.age[idx[aging]] == self.for_animals(self.death_age[breed], idx[aging])
+        alive = idx[~dead]
+        self.energy[alive] -= self.for_animals(self.energy_decay[breed], alive)
+        return idx[dead]
+
+    def update_population(self, dead: np.ndarray, parents: np.ndarray, child_energy: np.ndarray) -> None:
+        """Append the newborns of the given parents and drop the dead animals.
+
+        Args:
+            dead (np.ndarray): Indices of the animals that died
+            parents (np.ndarray): Indices of the animals giving birth
+            child_energy (np.ndarray): Initial energy of each newborn
+        """
+        keep = np.ones(self.breed.size, dtype=bool)
+        keep[dead] = False
+        ids = child_ids(self.id[parents], self.steps)
+        for name in self.inherited:
+            values = getattr(self, name)
+            setattr(self, name, np.concatenate([values[keep], values[parents]]))
+        self.id = np.concatenate([self.id[keep], ids])
+        self.energy = np.concatenate([self.energy[keep], child_energy])
+        self.age = np.concatenate([self.age[keep], np.zeros(parents.size, dtype=np.int64)])
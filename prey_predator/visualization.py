@@ -0,0 +1,169 @@
+"""
+Incremental visualization of large grids.
+================================
+
+CanvasGrid builds one portrayal dict per agent and per grass patch and sends
+the whole grid at every frame, which does not scale past a few thousand
+cells. DeltaCanvasGrid instead packs each cell into a single integer (number
+of wolves, number of sheep, grass grown) computed with array operations, and
+sends only the cells that changed since the previous frame. The browser side
+(js/DeltaCanvasModule.js) draws the agent shapes when cells are big enough
+and a heatmap otherwise.
+
+DeltaServer lets the model advance several steps per frame, so the
+simulation rate is not capped by the frame rate of the browser.
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+import tornado.escape
+from mesa import Model
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler, VisualizationElement
+
+from prey_predator.agents import Sheep, Wolf
+from prey_predator.vectorized import BREED_CODES
+
+# Counts above this are drawn the same, they must fit in the packed cell value
+MAX_COUNT = 255
+
+
+def breed_counts(model: Model, breed: type) -> np.ndarray:
+    """Number of animals of a breed in each cell, as a (width, height) array"""
+    width, height = model.grid.width, model.grid.height
+    if model.engine == "numpy":
+        ecosystem = model.ecosystem
+        idx = np.flatnonzero(ecosystem.breed == BREED_CODES[breed])
+        return np.bincount(ecosystem.cell_of(idx), minlength=width * height).reshape(width, height)
+
+    counts = np.zeros((width, height), dtype=np.int64)
+    cells = model.grid.by_breed[breed]
+    if cells:
+        xs, ys = zip(*cells)
+        counts[xs, ys] = [len(agents) for agents in cells.values()]
+    return counts
+
+
+def cell_values(model: Model) -> np.ndarray:
+    """State of each cell packed as ``wolves << 9 | sheep << 1 | grass``
+
+    Returns:
+        np.ndarray: (width, height) array of the packed values
+    """
+    wolves = np.minimum(breed_counts(model, Wolf), MAX_COUNT)
+    sheep = np.minimum(breed_counts(model, Sheep), MAX_COUNT)
+    return wolves << 9 | sheep << 1 | model.grass_layer.fully_grown.astype(np.int64)
+
+
+def frame_delta(previous: Optional[np.ndarray], values: np.ndarray) -> Dict[str, Any]:
+    """Frame turning a view showing ``previous`` into one showing ``values``
+
+    Args:
+        previous (Optional[np.ndarray]): Flat cell values the view shows, None
+            if it shows nothing yet
+        values (np.ndarray): Flat cell values to show
+
+    Returns:
+        Dict[str, Any]: Frame, see DeltaCanvasGrid
+    """
+    if previous is None or previous.shape != values.shape:
+        return {"full": True, "values": values.tolist()}
+    changed = np.flatnonzero(values != previous)
+    # A changed cell costs its index and its value, about twice a cell of a full frame
+    if 3 * changed.size > values.size:
+        return {"full": True, "values": values.tolist()}
+    return {"full": False, "cells": changed.tolist(), "values": values[changed].tolist()}
+
+
+class DeltaCanvasGrid(VisualizationElement):
+    """
+    Grid view sending the cells that changed since the previous frame only.
+
+    A frame is either ``{"full": True, "values": [...]}`` with the packed
+    value of every cell, flattened along the height, or ``{"full": False,
+    "cells": [...], "values": [...]}`` with the flat index and new value of
+    the changed cells, relative to the last frame sent to the same
+    connection. A full frame is sent to a new connection, for a new model,
+    e.g. after a reset, and whenever it is the smaller of the two.
+    """
+
+    local_includes = ["prey_predator/js/DeltaCanvasModule.js"]
+
+    def __init__(self, grid_width: int, grid_height: int, canvas_width: int = 500, canvas_height: int = 500):
+        """
+        Args:
+            grid_width, grid_height: Size of the grid, in cells
+            canvas_width, canvas_height: Size of the canvas, in pixels
+        """
+        super().__init__()
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        new_element = (f"new DeltaCanvasModule({canvas_width}, {canvas_height}, "
+                       f"{grid_width}, {grid_height})")
+        self.js_code = "elements.push(" + new_element + ");"
+
+    def render(self, model: Model, shown: Optional[Dict[Any, Any]] = None) -> Dict[str, Any]:
+        """Frame of the model for one connection
+
+        Args:
+            model (Model): Model to show
+            shown (Optional[Dict[Any, Any]]): State of the connection, where the
+                element keeps the model and values it last sent there. Without
+                it, the frame is a full one.
+        """
+        values = cell_values(model).ravel()
+        previous = None
+        if shown is not None:
+            last_model, last_values = shown.get(self, (None, None))
+            if last_model is model:
+                previous = last_values
+            shown[self] = (model, values)
+        return frame_delta(previous, values)
+
+
+class FrameSocketHandler(SocketHandler):
+    """Socket handler advancing the model ``steps_per_frame`` steps per frame
+
+    Each connection keeps what was last sent to it, so that the frames of a
+    viewer are deltas of what that viewer shows even when several share the
+    server.
+    """
+
+    def open(self):
+        self.shown = {}
+        super().open()
+
+    @property
+    def viz_state_message(self):
+        return {"type": "viz_state", "data": self.application.render_model(self.shown)}
+
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] == "get_step":
+            model = self.application.model
+            for _ in range(self.application.steps_per_frame - 1):
+                if not model.running:
+                    break
+                model.step()
+        super().on_message(message)
+
+
+class DeltaServer(ModularServer):
+    """
+    ModularServer whose model runs ``steps_per_frame`` steps between two
+    frames, the frames per second being set in the browser.
+    """
+
+    socket_handler = (r"/ws", FrameSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler,
+                ModularServer.static_handler, ModularServer.local_handler]
+
+    steps_per_frame = 1
+
+    def render_model(self, shown: Optional[Dict[Any, Any]] = None):
+        """Visualization state of the model for the connection whose state is ``shown``"""
+        return [element.render(self.model, shown) if isinstance(element, DeltaCanvasGrid)
+                else element.render(self.model)
+                for element in self.visualization_elements]
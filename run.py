@@ -1,3 +1,23 @@
-from prey_predator.server import server
+import argparse
 
-server.launch()
+parser = argparse.ArgumentParser(description="Visualize the prey-predator model")
+parser.add_argument("--live", action="store_true",
+                    help="Run the model in the background and stream it, instead of stepping it on request")
+parser.add_argument("--fps", type=float, default=10, help="Most frames per second of the live view")
+parser.add_argument("--steps-per-second", type=float, help="Most steps per second of the live model")
+args = parser.parse_args()
+
+if args.live:
+    from mesa.visualization.UserParam import UserSettableParameter
+
+    from prey_predator.live import launch
+    from prey_predator.server import model_params
+
+    # Default values of the server's parameters
+    params = {name: value.value if isinstance(value, UserSettableParameter) else value
+              for name, value in model_params.items()}
+    launch(params, max_fps=args.fps, steps_per_second=args.steps_per_second)
+else:
+    from prey_predator.server import server
+
+    server.launch()